@@ -1,11 +1,15 @@
 # -*- mode: python ; coding: utf-8 -*-
+import subprocess
+import sys
 
+# Pad the icon at build time so the app does not need PIL to load it at startup.
+subprocess.run([sys.executable, 'build_icon.py'], check=True)
 
 a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[('icon.ico', '.')],
+    datas=[('icon.ico', '.'), ('icon.png', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -26,7 +30,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -39,7 +43,7 @@ coll = COLLECT(
     a.binaries,
     a.datas,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
     name='F1FlagDesktop',
 )
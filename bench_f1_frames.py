@@ -0,0 +1,86 @@
+"""
+Micro-benchmark for F1Monitor.process_message.
+Compares the original parse-everything implementation with the current fast path.
+
+Usage:
+    python bench_f1_frames.py [recording]
+
+The recording is a file written by f1_recorder.py. Without one a synthetic mix
+of keepalives, ignored topics and flag traffic is used.
+"""
+import asyncio
+import json
+import sys
+import time
+from f1_monitor import F1Monitor
+from f1_recorder import read_frames
+
+
+class LegacyF1Monitor(F1Monitor):
+    """process_message as it was before the fast path: one json.loads and one callback per message."""
+    async def process_message(self, raw_data):
+        try:
+            parsed = json.loads(raw_data)
+            if 'M' in parsed and isinstance(parsed['M'], list):
+                for message in parsed['M']:
+                    if message.get('M') == 'feed':
+                        field, value = message['A'][0], message['A'][1]
+                        if field.endswith('.z'):
+                            value = self.decompress(value)
+                            field = field.split('.')[0]
+                        await self.on_update({field: value})
+            elif 'R' in parsed and (parsed.get('I') == '1' or parsed.get('I') == 1):
+                bulk = {}
+                for f, v in parsed['R'].items():
+                    if f.endswith('.z'):
+                        v = self.decompress(v)
+                        f = f.split('.')[0]
+                    bulk[f] = v
+                await self.on_update(bulk)
+        except Exception: pass
+
+
+def synthetic_frames(count=20000):
+    utc = "2024-03-02T15:04:05.123Z"
+    timing = json.dumps({"M": [{"H": "Streaming", "M": "feed", "A": [
+        "TimingData", {"Lines": {str(n): {"Sectors": {"1": {"Value": "28.123"}}} for n in range(1, 21)}}, utc]}]})
+    heartbeat = json.dumps({"M": [{"H": "Streaming", "M": "feed", "A": ["Heartbeat", {"Utc": utc}, utc]}]})
+    flag = json.dumps({"M": [
+        {"H": "Streaming", "M": "feed", "A": ["TrackStatus", {"Status": "2", "Message": "Yellow"}, utc]},
+        {"H": "Streaming", "M": "feed", "A": ["RaceControlMessages", {"Messages": {"7": {"Message": "YELLOW IN TRACK SECTOR 4"}}}, utc]},
+    ]})
+    pattern = ["{}", "{}", timing, heartbeat, "{}", timing, flag, "{}"]
+    return [pattern[i % len(pattern)] for i in range(count)]
+
+
+async def measure(monitor_cls, frames, rounds=5):
+    calls = 0
+
+    async def on_update(update):
+        nonlocal calls
+        calls += 1
+
+    monitor = monitor_cls(on_update, lambda msg: None)
+    best = float("inf")
+    for _ in range(rounds):
+        calls = 0
+        start = time.perf_counter()
+        for frame in frames:
+            await monitor.process_message(frame)
+        best = min(best, time.perf_counter() - start)
+    return len(frames) / best, calls
+
+
+async def main():
+    frames = [frame for _, frame in read_frames(sys.argv[1])] if len(sys.argv) > 1 else synthetic_frames()
+    source = sys.argv[1] if len(sys.argv) > 1 else "tráfico sintético"
+    print(f"Frames: {len(frames)} ({source})")
+    before, before_calls = await measure(LegacyF1Monitor, frames)
+    after, after_calls = await measure(F1Monitor, frames)
+    print(f"Antes:   {before:>12,.0f} frames/s  ({before_calls} callbacks)")
+    print(f"Después: {after:>12,.0f} frames/s  ({after_calls} callbacks)")
+    print(f"Mejora:  {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
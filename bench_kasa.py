@@ -0,0 +1,83 @@
+"""
+Throughput and tail-latency benchmark for KasaManager against kasa_simulator.py.
+Runs fully offline: no physical bulb is needed.
+
+Usage:
+    python bench_kasa.py [--count 200] [--latency 0.02] [--jitter 0.01] [--loss 0]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import kasa_manager
+from kasa_manager import KasaManager
+from kasa_simulator import SimulatedBulb
+from metrics import RollingHistogram
+
+
+def fmt(values):
+    return "/".join(f"{values[q] * 1000:.1f}" for q in (0.5, 0.95, 0.99)) + " ms"
+
+
+async def timed_connect(address):
+    manager = KasaManager(address, "", "", groups={})
+    started = time.perf_counter()
+    await manager.connect()
+    return manager, time.perf_counter() - started
+
+
+async def main(args):
+    # Keep the benchmark's discovery cache away from the real one.
+    kasa_manager.DISCOVERY_CACHE_FILE = os.path.join(tempfile.mkdtemp(), "kasa_devices.json")
+    kasa_manager.discovery_cache.clear()
+
+    bulb = await SimulatedBulb(port=args.port, latency=args.latency, jitter=args.jitter,
+                               loss=args.loss, seed=1).start()
+    try:
+        _, discover_time = await timed_connect(bulb.address)
+        manager, cached_time = await timed_connect(bulb.address)
+        print(f"Conexión con descubrimiento: {discover_time * 1000:.1f} ms")
+        print(f"Conexión desde caché:        {cached_time * 1000:.1f} ms")
+
+        # Sequential flag changes: one network exchange each.
+        hist = RollingHistogram(size=args.count)
+        codes = ["1", "2", "4", "5", "6"]
+        before = len(bulb.commands)
+        started = time.perf_counter()
+        for i in range(args.count):
+            t0 = time.perf_counter()
+            await manager.set_color(codes[i % len(codes)])
+            hist.observe(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+        sent = len(bulb.commands) - before
+        print(f"Secuencial: {args.count / elapsed:.1f} cambios/s, p50/p95/p99 {fmt(hist.percentiles())}, "
+              f"{sent / args.count:.2f} comandos por cambio")
+
+        # A burst of concurrent flips collapses into the latest target.
+        await manager.set_color("1")
+        burst = [codes[i % len(codes)] for i in range(49)] + ["5"]
+        before = len(bulb.commands)
+        started = time.perf_counter()
+        await asyncio.gather(*(manager.set_color(code) for code in burst))
+        print(f"Ráfaga de 50 cambios: {len(bulb.commands) - before} comandos, "
+              f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+        # Reconnect after the bulb drops every connection.
+        bulb.disconnect_all()
+        started = time.perf_counter()
+        await manager.set_color("5")
+        await manager.set_color("1")
+        print(f"Recuperación tras desconexión: {(time.perf_counter() - started) * 1000:.1f} ms")
+    finally:
+        await bulb.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de KasaManager contra el simulador local.")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--loss", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,104 @@
+"""
+Benchmark of the streaming flag-field scan (json_scan.py) against a full json.loads
+of NASCAR live-feed.json: parse time and peak memory per payload.
+
+Usage:
+    python bench_nascar_parse.py                      # synthetic 40-car payloads
+    python bench_nascar_parse.py feed1.json feed2.json
+    python bench_nascar_parse.py --save feed.json     # record the live feed once
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from nascar_monitor import FLAG_FIELDS, CHUNK_SIZE
+from json_scan import scan_fields
+
+
+def synthetic_feed(vehicles=40, lap=150, fields_first=True, seed=1):
+    """A payload shaped like live-feed.json: flag scalars plus per-vehicle detail."""
+    rng = random.Random(seed)
+    head = {"lap_number": lap, "elapsed_time": lap * 31, "flag_state": 1, "race_id": 5400,
+            "laps_in_race": 267, "laps_to_go": 267 - lap}
+    cars = []
+    for pos in range(1, vehicles + 1):
+        cars.append({
+            "average_restart_speed": rng.uniform(60, 90), "average_running_position": rng.uniform(1, 40),
+            "average_speed": rng.uniform(120, 170), "best_lap": rng.randint(1, lap),
+            "best_lap_speed": rng.uniform(170, 180), "best_lap_time": rng.uniform(29, 31),
+            "vehicle_manufacturer": rng.choice(["Chv", "Frd", "Tyt"]), "vehicle_number": str(pos),
+            "driver": {"driver_id": 4000 + pos, "full_name": f"Driver {pos}", "first_name": "Driver",
+                       "last_name": str(pos), "is_in_chase": False},
+            "vehicle_elapsed_time": lap * 31.0, "laps_completed": lap - rng.randint(0, 2),
+            "laps_led": [{"start_lap": a, "end_lap": a + rng.randint(0, 9)} for a in range(0, lap, 50)],
+            "last_lap_speed": rng.uniform(160, 180), "last_lap_time": rng.uniform(29, 32),
+            "passes_made": rng.randint(0, 200), "passing_differential": rng.randint(-50, 50),
+            "pit_stops": [{"positions_gained_lossed": rng.randint(-5, 5), "pit_in_elapsed_time": t * 1.0,
+                           "pit_in_lap_count": t // 31, "pit_in_rank": pos, "pit_out_rank": pos,
+                           "pit_out_elapsed_time": t + 12.5} for t in range(900, lap * 31, 1800)],
+            "running_position": pos, "status": 1, "delta": rng.uniform(0, 30),
+            "sponsor_name": f"Sponsor {pos}", "starting_position": rng.randint(1, 40),
+            "is_on_track": True, "is_on_dvp": False,
+        })
+    tail = {"run_id": 1, "run_name": "Cup Series Race", "series_id": 1, "track_name": "Speedway",
+            "stage": {"stage_num": 2, "finish_at_lap": 185, "laps_in_stage": 90}}
+    feed = dict(head, vehicles=cars, **tail) if fields_first else dict(vehicles=cars, **tail, **head)
+    return json.dumps(feed).encode()
+
+
+def chunks_of(payload):
+    return [payload[i:i + CHUNK_SIZE] for i in range(0, len(payload), CHUNK_SIZE)]
+
+
+def measure(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def bench(name, payload, repeat):
+    chunks = chunks_of(payload)
+    full = json.loads(payload)
+    found, scanned = scan_fields(chunks, FLAG_FIELDS)
+    assert found == {k: full[k] for k in FLAG_FIELDS if k in full}, "el escaneo no coincide con json.loads"
+
+    loads_time, loads_peak = measure(lambda: json.loads(b"".join(chunks)), repeat)
+    scan_time, scan_peak = measure(lambda: scan_fields(iter(chunks), FLAG_FIELDS), repeat)
+    print(f"{name} ({len(payload) / 1024:.0f} KB, escaneado {scanned / 1024:.0f} KB)")
+    print(f"  json.loads     {loads_time * 1000:8.3f} ms  pico {loads_peak / 1024:8.0f} KB")
+    print(f"  escaneo        {scan_time * 1000:8.3f} ms  pico {scan_peak / 1024:8.0f} KB"
+          f"  ({loads_time / scan_time:.1f}x más rápido)")
+
+
+def main(args):
+    if args.save:
+        import requests
+        resp = requests.get("https://cf.nascar.com/live/feeds/live-feed.json", timeout=10)
+        resp.raise_for_status()
+        with open(args.save, "wb") as f:
+            f.write(resp.content)
+        print(f"Guardado {args.save} ({len(resp.content)} bytes)")
+        return
+    if args.payloads:
+        for path in args.payloads:
+            with open(path, "rb") as f:
+                bench(path, f.read(), args.repeat)
+    else:
+        bench("sintético, banderas al principio", synthetic_feed(), args.repeat)
+        bench("sintético, banderas al final", synthetic_feed(fields_first=False), args.repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Escaneo en streaming frente a json.loads de live-feed.json.")
+    parser.add_argument("payloads", nargs="*", help="respuestas grabadas de live-feed.json")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--save", metavar="ARCHIVO", help="descarga live-feed.json una vez y lo guarda")
+    main(parser.parse_args())
@@ -0,0 +1,94 @@
+"""
+Cold-start benchmark: import cost of what main.py loads before the window is up,
+against the old eager import set, plus the network stack of each series.
+
+With a display and an F1 recording it also launches the app for real and reads its
+startup milestones (window up, first flag, first light) from --startup-probe:
+
+    python bench_startup.py
+    python bench_startup.py --replay session.rec.gz --budget 1000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Imported by main.py before the window is shown.
+UI_IMPORTS = ["gui", "kasa_manager", "config", "metrics"]
+# What main.py used to import up front.
+EAGER_IMPORTS = ["customtkinter", "kasa", "websockets", "requests", "f1_monitor",
+                 "nascar_monitor", "motogp_monitor", "f1_recorder", "gui"]
+# Loaded in the background once the window is up.
+SERIES_IMPORTS = {
+    "f1": ["f1_monitor"],
+    "nascar": ["nascar_monitor"],
+    "motogp": ["motogp_monitor"],
+    "kasa": ["kasa"],
+}
+
+
+def cold_import_ms(modules, runs):
+    """Median wall time of a fresh interpreter importing `modules`, minus an empty one."""
+    def run(code):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if result.returncode:
+            raise ImportError(result.stderr.strip().splitlines()[-1])
+        return time.perf_counter() - started
+
+    code = "import " + ", ".join(modules)
+    empty = statistics.median(run("pass") for _ in range(runs))
+    return (statistics.median(run(code) for _ in range(runs)) - empty) * 1000
+
+
+def report(label, modules, runs):
+    try:
+        ms = cold_import_ms(modules, runs)
+        print(f"{label:<28} {ms:7.0f} ms")
+        return ms
+    except ImportError as e:
+        print(f"{label:<28}     n/d ({e})")
+        return None
+
+
+def probe_app(replay):
+    """Launches main.py on a recording and returns its startup milestones."""
+    result = subprocess.run([sys.executable, "main.py", "--replay", replay, "--speed", "0", "--startup-probe"],
+                            capture_output=True, text=True, timeout=120)
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(result.stderr.strip() or "main.py no informó tiempos de arranque")
+
+
+def main(args):
+    print("Importaciones en frío (mediana de", args.runs, "ejecuciones):")
+    ui_ms = report("antes de la interfaz", UI_IMPORTS, args.runs)
+    report("importación completa previa", EAGER_IMPORTS, args.runs)
+    for series, modules in SERIES_IMPORTS.items():
+        report(f"  en segundo plano: {series}", modules, args.runs)
+
+    over_budget = False
+    if args.replay:
+        if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+            print("Sin pantalla: se omite el arranque completo de la aplicación.")
+        else:
+            times = probe_app(args.replay)
+            print("Arranque de la aplicación:", ", ".join(f"{k} {v} ms" for k, v in times.items()))
+            over_budget = times.get("first_flag", float("inf")) > args.budget
+    elif ui_ms is not None:
+        over_budget = ui_ms > args.budget
+
+    print(f"Presupuesto {args.budget} ms: {'SUPERADO' if over_budget else 'OK'}")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el arranque en frío de la aplicación.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--replay", help="grabación de F1 para medir el tiempo hasta la primera bandera")
+    parser.add_argument("--budget", type=int, default=1000, help="ms hasta la primera bandera (o hasta la interfaz)")
+    sys.exit(main(parser.parse_args()))
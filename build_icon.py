@@ -0,0 +1,57 @@
+"""
+Build step: writes icon.png, the window icon padded to a transparent square, so the
+app can hand it straight to Tk at startup instead of decoding and padding icon.ico
+with PIL on every launch. Run by the PyInstaller specs; run it by hand after
+changing icon.ico.
+
+Usage:
+    python build_icon.py [icon.ico] [icon.png]
+"""
+import struct
+import sys
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def largest_ico_entry(data):
+    """Returns the bytes of the biggest image stored in an .ico file."""
+    _, _, count = struct.unpack("<HHH", data[:6])
+    best = None
+    for i in range(count):
+        width, height, _, _, _, _, size, offset = struct.unpack("<BBBBHHII", data[6 + 16 * i:22 + 16 * i])
+        area = (width or 256) * (height or 256)  # 0 means 256
+        if best is None or area > best[0]:
+            best = (area, data[offset:offset + size])
+    return best[1]
+
+
+def png_size(data):
+    return struct.unpack(">II", data[16:24])
+
+
+def build_icon(src="icon.ico", dst="icon.png"):
+    with open(src, "rb") as f:
+        image = largest_ico_entry(f.read())
+    if image.startswith(PNG_SIGNATURE):
+        width, height = png_size(image)
+        if width == height:
+            # Already square: the embedded PNG is the icon as is.
+            with open(dst, "wb") as f:
+                f.write(image)
+            return dst
+
+    from PIL import Image
+    img = Image.open(src)
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    # Windows automatically stretches rectangular icons to a square,
+    # so we pad it with transparent pixels to be a perfect square.
+    max_dim = max(img.size)
+    square_img = Image.new("RGBA", (max_dim, max_dim), (255, 255, 255, 0))
+    square_img.paste(img, ((max_dim - img.size[0]) // 2, (max_dim - img.size[1]) // 2))
+    square_img.save(dst, optimize=True)
+    return dst
+
+
+if __name__ == "__main__":
+    print(f"Icono generado: {build_icon(*sys.argv[1:3])}")
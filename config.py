@@ -25,11 +25,42 @@ settings = load_settings()
 KASA_USERNAME = settings.get("KASA_USERNAME", "")
 KASA_PASSWORD = settings.get("KASA_PASSWORD", "")
 KASA_IP = settings.get("KASA_IP", "")
+# Extra bulbs/strips by group name, e.g. {"salon": ["192.168.1.20", "192.168.1.21"]}
+KASA_GROUPS = settings.get("KASA_GROUPS", {})
+# Broadcast delay in seconds (fractions allowed) or per series, e.g. {"f1": 31.5, "default": 0}.
 DELAY = settings.get("DELAY", 0)
+# Seconds without any F1 frame before the socket is considered dead and replaced.
+F1_STALE_TIMEOUT = settings.get("F1_STALE_TIMEOUT", 30)
+# Polling intervals (seconds) of the NASCAR and MotoGP monitors by race state.
+# "idle" and "error" back off exponentially up to "idle_max".
+POLL_INTERVALS = {"racing": 2, "final_laps": 1, "caution": 5, "error": 15, "idle": 60, "idle_max": 600}
+POLL_INTERVALS.update(settings.get("POLL_INTERVALS", {}))
+# Hard ceiling on requests per second per polled feed.
+MAX_POLL_RATE = settings.get("MAX_POLL_RATE", 1.0)
+# Extra series monitored from startup alongside the selected one, so switching to
+# them is instant and PRIORITY can watch them; e.g. ["f1", "nascar", "motogp"].
+# Empty (default): only the selected series runs, and others start when selected.
+MONITORED_SERIES = settings.get("MONITORED_SERIES", [])
+# Flag codes per series that take the bulb even when another series is selected,
+# e.g. {"nascar": ["3"]}. "red" means every series' red flag; empty disables it.
+RED_FLAGS = {"f1": ["5"], "nascar": ["3"], "motogp": ["R", "C"]}
+PRIORITY = settings.get("PRIORITY", {})
+if PRIORITY == "red":
+    PRIORITY = RED_FLAGS
+
+# Rotating log file ("" disables it) and lines kept in the GUI log view.
+LOG_FILE = settings.get("LOG_FILE", "f1flag.log")
+LOG_MAX_BYTES = settings.get("LOG_MAX_BYTES", 1_000_000)
+LOG_BACKUPS = settings.get("LOG_BACKUPS", 3)
+LOG_LINES = settings.get("LOG_LINES", 500)
 
 # --- SIGNALR CONSTANTS ---
+LIVETIMING_URL = "https://livetiming.formula1.com"
 SIGNALR_HUB = "Streaming"
 F1_UA = "BestHTTP"
+# Topics the F1 monitor subscribes to by default. Compressed feeds use the ".z"
+# suffix (e.g. "CarData.z", "Position.z") and are only inflated when read.
+F1_TOPICS = ["TrackStatus", "RaceControlMessages", "SessionInfo"]
 
 # --- COLOR MAPPING ---
 # Format: (Hue, Saturation, Brightness, Label, ColorHex)
@@ -68,3 +99,26 @@ MOTOGP_COLORS = {
     "F": (0, 0, 50, "Bandera a Cuadros", "#808080"),       # Chequered / Finished
     "C": (0, 100, 50, "Bandera Roja", "#FF0000"),          # Cancelled? treating as red
 }
+
+# --- FLAG LIGHT EFFECTS ---
+# Optional timed effect per series and flag code, run after the flag's base color
+# (which is the pulse/strobe color and the fade starting point). Types:
+#   pulse:  brightness breathes down to "min" and back every "period" seconds
+#   strobe: square wave between the flag brightness and "min" ("period", "duty")
+#   fade:   fades to the color of code "to" over "duration" seconds, then holds it
+# The frame rate is capped automatically to what the bulbs can sustain.
+# Override in settings.json ("EFFECTS": {} disables them).
+EFFECTS = settings.get("EFFECTS", {
+    "f1": {
+        "4": {"type": "pulse", "period": 2.0, "min": 15},     # Safety Car
+        "5": {"type": "strobe", "period": 1.0, "min": 1},     # Red flag
+        "7": {"type": "fade", "to": "1", "duration": 5.0},    # VSC ending -> green
+    },
+    "nascar": {
+        "2": {"type": "pulse", "period": 2.0, "min": 15},     # Caution
+        "3": {"type": "strobe", "period": 1.0, "min": 1},     # Red
+    },
+    "motogp": {
+        "R": {"type": "strobe", "period": 1.0, "min": 1},     # Red flag
+    },
+})
@@ -0,0 +1,30 @@
+import time
+
+
+class ConnectionState:
+    """Mixin for monitors: `connected` calls `on_connection_change(connected)` when it flips.
+
+    The supervisor in main.py sets the callback, so the UI follows the connection
+    without anyone polling the flag. Monitors also stamp `last_frame_at` with
+    time.monotonic() on every frame or successful poll.
+    """
+    _connected = False
+    on_connection_change = None
+    last_frame_at = None
+
+    def seconds_since_last_frame(self):
+        if self.last_frame_at is None:
+            return None
+        return time.monotonic() - self.last_frame_at
+
+    @property
+    def connected(self):
+        return self._connected
+
+    @connected.setter
+    def connected(self, value):
+        if value == self._connected:
+            return
+        self._connected = value
+        if self.on_connection_change is not None:
+            self.on_connection_change(value)
@@ -0,0 +1,192 @@
+"""
+Headless service mode: the same monitors, arbitration and bulb pipeline as main.py,
+without a display. Nothing here imports tkinter, customtkinter or PIL.
+
+Control:
+    settings.json   "SERIES" picks the series shown on the bulb (plus the usual
+                    KASA_*, DELAY, MONITORED_SERIES, PRIORITY... keys)
+    SIGHUP          reloads settings.json (SERIES, DELAY and other per-call settings;
+                    bulb addresses and monitored series need a restart)
+    SIGUSR1         logs the current flag, connections and latency percentiles
+    SIGUSR2         calibrates DELAY: send it when the latest flag change appears on
+                    the stream (e.g. from a push button); the result is saved
+    SIGTERM/SIGINT  clean shutdown
+
+Usage:
+    python daemon.py                    # run until stopped
+    python daemon.py --check-budget     # start, settle, check RSS and startup time, exit 0/1
+"""
+import time
+STARTED = time.perf_counter()
+
+import asyncio
+import json
+import signal
+import sys
+import config
+import main
+from kasa_manager import KasaManager
+from log_pipeline import logger as file_log, start_file_log
+from metrics import registry as metrics
+
+# Published footprint of the daemon on a Raspberry Pi class machine.
+RSS_BUDGET_MB = 80
+STARTUP_BUDGET_MS = 1500   # process start until the first monitor is running
+SETTLE_SECONDS = 10
+GUI_MODULES = ("tkinter", "customtkinter", "PIL")
+
+
+def resident_mb():
+    """Current resident set size in MB, or None where it cannot be read."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Peak instead of current: kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class HeadlessHost:
+    """Implements the part of F1FlagApp that main_logic uses, on the loop's own thread."""
+    def __init__(self, kasa_mgr, series):
+        self.kasa_mgr = kasa_mgr
+        self.selected_series = series
+        self.kasa_mgr.set_series(series)
+        self.current_status_code = None
+        self.monitor_connected = None
+        self.active_monitor = None
+        self.monitor_thread_loop = None
+        self.series_change_event = None
+        self.delay_buffer = None
+        self.stopped = asyncio.Event()
+
+    def add_log(self, msg):
+        print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+        file_log.info(msg)
+
+    def post_status(self, series=None, code=None, connected=None):
+        if code is not None and series in (None, self.selected_series):
+            self.current_status_code = code
+        self.update_status_ui(connected)
+
+    def update_status_ui(self, monitor_connected=None):
+        if monitor_connected is None or monitor_connected == bool(self.monitor_connected):
+            return
+        self.monitor_connected = monitor_connected
+        state = "conectado" if monitor_connected else "desconectado"
+        self.add_log(f"[Sistema] Monitor {self.selected_series.upper()} {state}")
+
+    def post_quit(self):
+        self.stopped.set()
+
+    def select(self, series):
+        series = series.lower()
+        if series not in main.SERIES_NAMES:
+            self.add_log(f"[Sistema] Serie desconocida: {series}")
+        elif series != self.selected_series:
+            self.selected_series = series
+            self.kasa_mgr.set_series(series)
+            self.series_change_event.set()
+
+    def reload(self):
+        fresh = config.load_settings()
+        config.settings.clear()
+        config.settings.update(fresh)
+        self.add_log(f"[Sistema] {config.SETTINGS_FILE} recargado")
+        self.delay_buffer.configure(fresh.get("DELAY", 0))
+        self.select(fresh.get("SERIES", self.selected_series))
+
+    def calibrate(self):
+        result = self.delay_buffer.calibrate(self.selected_series)
+        if result is None:
+            self.add_log(f"[Sistema] Aún no ha llegado ninguna bandera de {self.selected_series.upper()} para calibrar")
+            return
+        delay, samples = result
+        config.settings["DELAY"] = self.delay_buffer.setting()
+        config.save_settings(config.settings)
+        self.add_log(f"[Sistema] Retardo de {self.selected_series.upper()} calibrado: {delay:.2f}s ({samples} marcas)")
+
+    def report(self):
+        monitor = self.active_monitor
+        connected = "conectado" if monitor and monitor.connected else "desconectado"
+        self.add_log(f"[Sistema] {self.selected_series.upper()}: bandera {self.current_status_code or '—'}, "
+                     f"monitor {connected}, bombilla {'conectada' if self.kasa_mgr.connected else 'desconectada'}, "
+                     f"latencia p50/p95/p99 {metrics.summary(self.selected_series)}, "
+                     f"{self.delay_buffer.pending()} cambios en el retardo")
+
+
+def check_budget(host, rss_budget, startup_budget):
+    """Prints the footprint report; returns True when every budget is met."""
+    rss = resident_mb()
+    startup = main.startup_times.get("monitor")
+    gui = [name for name in GUI_MODULES if name in sys.modules]
+    report = {
+        "rss_mb": None if rss is None else round(rss, 1),
+        "rss_budget_mb": rss_budget,
+        "startup_ms": startup,
+        "startup_budget_ms": startup_budget,
+        "gui_modules": gui,
+    }
+    ok = (rss is None or rss <= rss_budget) and startup is not None and startup <= startup_budget and not gui
+    report["ok"] = ok
+    print(json.dumps(report), flush=True)
+    return ok
+
+
+async def run(options):
+    loop = asyncio.get_running_loop()
+    kasa_mgr = KasaManager(config.KASA_IP, config.KASA_USERNAME, config.KASA_PASSWORD)
+    host = HeadlessHost(kasa_mgr, options.series or config.settings.get("SERIES", "f1"))
+    host.monitor_thread_loop = loop
+    logic = asyncio.create_task(main.main_logic(host, options))
+
+    handlers = {"SIGTERM": host.post_quit, "SIGINT": host.post_quit, "SIGHUP": host.reload,
+                "SIGUSR1": host.report, "SIGUSR2": host.calibrate}
+    for name, handler in handlers.items():
+        if hasattr(signal, name):
+            try:
+                loop.add_signal_handler(getattr(signal, name), handler)
+            except NotImplementedError:
+                pass  # Windows: only Ctrl+C, handled by asyncio.run
+
+    ok = True
+    if options.check_budget:
+        await asyncio.wait({logic, asyncio.create_task(host.stopped.wait())}, timeout=options.settle)
+        ok = check_budget(host, options.rss_budget, options.startup_budget)
+    else:
+        await asyncio.wait({logic, asyncio.create_task(host.stopped.wait())}, return_when=asyncio.FIRST_COMPLETED)
+    host.add_log("[Sistema] Deteniendo...")
+    logic.cancel()
+    await asyncio.gather(logic, return_exceptions=True)
+    return ok
+
+
+def parse_args():
+    parser = main.build_parser("Racing Flag Monitor (sin interfaz)")
+    parser.add_argument("--series", choices=sorted(main.SERIES_NAMES), help="serie inicial (por defecto SERIES en settings.json)")
+    parser.add_argument("--check-budget", action="store_true",
+                        help="arranca, espera --settle segundos y comprueba memoria y tiempo de arranque")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS)
+    parser.add_argument("--rss-budget", type=float, default=RSS_BUDGET_MB, metavar="MB")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET_MS, metavar="MS")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main.STARTED = STARTED
+    options = parse_args()
+    log_listener = start_file_log()
+    try:
+        ok = asyncio.run(run(options))
+    finally:
+        if log_listener:
+            log_listener.stop()
+    sys.exit(0 if ok else 1)
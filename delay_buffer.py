@@ -0,0 +1,91 @@
+"""
+Broadcast-delay buffer: every flag transition is replayed at exactly its arrival
+time plus the series' delay, so the bulb follows the TV stream instead of the live
+feed. Each transition gets its own loop.call_at timer on the monotonic clock, so a
+yellow that clears within the delay window still shows, for as long as it lasted.
+
+DELAY is a number of seconds (fractions allowed) or a per-series map such as
+{"f1": 31.5, "nascar": 12, "default": 0}. It is read once; configure() applies a
+new value and only affects transitions pushed afterwards.
+
+Calibration: press the mark when the latest flag change appears on the stream;
+the gap to its live arrival becomes that series' delay (median of the last marks).
+"""
+import asyncio
+import statistics
+from collections import deque
+from metrics import registry as metrics
+
+ARRIVALS_KEPT = 20
+CALIBRATION_SAMPLES = 5
+
+
+class DelayBuffer:
+    """Time-shifts (series, code) transitions; deliver(series, code, arrival) runs on the loop."""
+    def __init__(self, deliver, delay=0, loop=None):
+        self.deliver = deliver
+        self.loop = loop or asyncio.get_running_loop()
+        self.default = 0.0
+        self.delays = {}
+        self.arrivals = {}   # series -> recent (arrival, code), for calibration
+        self.samples = {}    # series -> recent calibration offsets
+        self._pending = set()
+        self.configure(delay)
+
+    def configure(self, delay):
+        if isinstance(delay, dict):
+            self.delays = {series: float(value) for series, value in delay.items() if series != "default"}
+            self.default = float(delay.get("default", 0))
+        else:
+            self.delays = {}
+            self.default = float(delay or 0)
+
+    def delay_for(self, series):
+        return self.delays.get(series, self.default)
+
+    def setting(self):
+        """The current delays in the DELAY settings format."""
+        if not self.delays:
+            return self.default
+        return dict(self.delays, default=self.default) if self.default else dict(self.delays)
+
+    def push(self, series, code, arrival=None):
+        """Queues a transition seen at `arrival` (monotonic seconds, default now)."""
+        arrival = self.loop.time() if arrival is None else arrival
+        self.arrivals.setdefault(series, deque(maxlen=ARRIVALS_KEPT)).append((arrival, code))
+        delay = self.delay_for(series)
+        if delay <= 0:
+            self.deliver(series, code, arrival)
+            return
+        due = arrival + delay
+        handle = self.loop.call_at(due, self._fire, series, code, arrival, due)
+        self._pending.add(handle)
+
+    def _fire(self, series, code, arrival, due):
+        now = self.loop.time()
+        metrics.observe(series, "delay", now - arrival)
+        metrics.observe(series, "delay_error", now - due)
+        self._pending = {handle for handle in self._pending if not handle.cancelled() and handle.when() > now}
+        self.deliver(series, code, arrival)
+
+    def pending(self):
+        return len(self._pending)
+
+    def calibrate(self, series, seen_at=None):
+        """Marks the latest transition as seen on the stream now (or at `seen_at`).
+
+        Returns (new delay, samples used), or None when no transition arrived yet.
+        """
+        arrivals = self.arrivals.get(series)
+        if not arrivals:
+            return None
+        seen_at = self.loop.time() if seen_at is None else seen_at
+        samples = self.samples.setdefault(series, deque(maxlen=CALIBRATION_SAMPLES))
+        samples.append(max(0.0, seen_at - arrivals[-1][0]))
+        self.delays[series] = round(statistics.median(samples), 2)
+        return self.delays[series], len(samples)
+
+    def close(self):
+        for handle in self._pending:
+            handle.cancel()
+        self._pending.clear()
@@ -1,82 +1,434 @@
 import json
 import base64
+import time
 import zlib
-import requests
 import asyncio
 import websockets
+from collections import deque
+from collections.abc import Mapping
+from datetime import datetime
 from urllib.parse import quote
-from config import SIGNALR_HUB, F1_UA
+from config import SIGNALR_HUB, F1_UA, F1_TOPICS, LIVETIMING_URL, F1_STALE_TIMEOUT
+from f1_state import LiveState
+from f1_schedule import SessionScheduler
+from metrics import registry as metrics
+from http_client import http
+from connection_state import ConnectionState
 
-class F1Monitor:
+# A negotiated ConnectionToken is kept ready in the background so a reconnect
+# never has to wait for the negotiate round trip.
+TOKEN_MAX_AGE = 120
+RECONNECT_BACKOFF = (0, 1, 2, 5, 10)
+# Heartbeat watchdog: a quiet socket gets a WebSocket ping after PING_AFTER seconds
+# and is replaced if the pong does not arrive or no frame came for stale_timeout.
+WATCHDOG_INTERVAL = 2
+PING_AFTER = 10
+PONG_TIMEOUT = 5
+
+def merge_delta(base, delta):
+    """Merges a SignalR partial update into base and returns the result.
+
+    Dicts are merged key by key; lists accept dict deltas keyed by index
+    ("0", "1", ...), which is how the feed appends to arrays.
+    """
+    if isinstance(base, dict) and isinstance(delta, dict):
+        for key, value in delta.items():
+            base[key] = merge_delta(base[key], value) if key in base else value
+        return base
+    if isinstance(base, list) and isinstance(delta, dict):
+        for key, value in delta.items():
+            try:
+                index = int(key)
+            except ValueError:
+                continue
+            if index < len(base):
+                base[index] = merge_delta(base[index], value)
+            else:
+                base.append(value)
+        return base
+    return delta
+
+def inflate(data):
+    """Decodes a base64 + raw-deflate `.z` payload into JSON."""
+    try:
+        decoded = base64.b64decode(data)
+        inflated = zlib.decompress(decoded, -zlib.MAX_WBITS).decode('utf-8')
+        return json.loads(inflated)
+    except Exception:
+        return {}
+
+class CompressedTopic(Mapping):
+    """A `.z` payload kept as received until someone actually reads it."""
+    __slots__ = ('raw', '_value')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._value = None
+
+    @property
+    def inflated(self):
+        return self._value is not None
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = inflate(self.raw)
+        return self._value
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __repr__(self):
+        state = "inflado" if self.inflated else f"{len(self.raw)} bytes"
+        return f"<CompressedTopic {state}>"
+
+class TopicRegistry:
+    """Reference-counted set of feed topics that consumers have subscribed to.
+
+    Topics are stored by their wire name ("CarData.z"); lookups use the name the
+    feed is delivered under ("CarData").
+    """
+    def __init__(self, topics=()):
+        self._counts = {}
+        self.names = ()
+        self.on_added = None
+        for topic in topics:
+            self.subscribe(topic)
+
+    def subscribe(self, topic):
+        count = self._counts.get(topic, 0)
+        self._counts[topic] = count + 1
+        if count == 0:
+            self._refresh()
+            if self.on_added:
+                self.on_added([topic])
+
+    def unsubscribe(self, topic):
+        count = self._counts.get(topic, 0)
+        if count <= 1:
+            self._counts.pop(topic, None)
+            self._refresh()
+        else:
+            self._counts[topic] = count - 1
+
+    def _refresh(self):
+        self.names = tuple(topic.split('.')[0] for topic in self._counts)
+
+    def wire_names(self):
+        return list(self._counts)
+
+    def __contains__(self, name):
+        return name in self.names
+
+class F1Monitor(ConnectionState):
     """Handles the connection to F1 Live Timing and data processing."""
-    def __init__(self, on_update_callback, logger):
+    def __init__(self, on_update_callback, logger, topics=None, scheduler=None, base_url=LIVETIMING_URL):
         self.on_update = on_update_callback
         self.log = logger
         self.connected = False
         self.loop = None
+        self.ws = None
+        self.topics = TopicRegistry(F1_TOPICS if topics is None else topics)
+        self.topics.on_added = self._on_topics_added
+        self.state = LiveState()
+        self.scheduler = scheduler or SessionScheduler()
+        self.state.watch("SessionInfo", lambda path, info: self.scheduler.note_session_info(info))
+        self.stale_timeout = F1_STALE_TIMEOUT
+        self.measure_feed_lag = True
+        self.recorder = None  # optional f1_recorder.SessionRecorder, gets every raw frame
+        self.reconnect_times = deque(maxlen=20)  # seconds without a live socket, per reconnect
+        self.hub_encoded = quote(f'[{{"name":"{SIGNALR_HUB}"}}]', safe='')
+        self.base_url = base_url
+        self.negotiate_url = (f"{base_url}/signalr/negotiate"
+                              f"?connectionData={self.hub_encoded}&clientProtocol=1.5")
+        self._standby_token = None  # (token, monotonic time it was negotiated)
+        self._standby_task = None
+        self._token_wanted = None
+        self._live = None  # asyncio.Event, set while a socket is connected
+        self._swap_task = None
+        self._watchdog_task = None
+        self._blind_since = None
 
     def decompress(self, data):
-        try:
-            decoded = base64.b64decode(data)
-            inflated = zlib.decompress(decoded, -zlib.MAX_WBITS).decode('utf-8')
-            return json.loads(inflated)
-        except Exception:
-            return {}
+        return inflate(data)
+
+    def subscribe(self, topic):
+        """Registers interest in a feed topic; use the ".z" name for compressed feeds.
+
+        Feed updates deliver a compressed topic as a list of CompressedTopic, one per
+        message in the frame; the initial snapshot delivers a single one.
+        """
+        self.topics.subscribe(topic)
+
+    def unsubscribe(self, topic):
+        self.topics.unsubscribe(topic)
+
+    def _on_topics_added(self, topics):
+        # Topics added while connected are subscribed on the live socket; otherwise
+        # they go out with the next Subscribe.
+        if self.ws is not None and self.loop is not None:
+            self.loop.create_task(self._send_subscribe(self.ws, topics))
+
+    async def _send_subscribe(self, ws, topics):
+        await ws.send(json.dumps({"H": SIGNALR_HUB, "M": "Subscribe", "A": [topics], "I": "1"}))
 
     async def process_message(self, raw_data):
+        # Fast path: keepalives ("{}") and frames that mention none of our topics
+        # are dropped on the raw text, before paying for json.loads.
+        if len(raw_data) <= 2 or not any(topic in raw_data for topic in self.topics.names):
+            return
         try:
             parsed = json.loads(raw_data)
             if 'M' in parsed and isinstance(parsed['M'], list):
+                # All feed messages in one frame are delivered in a single callback.
+                batch = {}
+                stamp = None
                 for message in parsed['M']:
                     if message.get('M') == 'feed':
-                        field, value = message['A']
+                        args = message['A']
+                        field, value = args[0], args[1]
+                        if len(args) > 2:
+                            stamp = args[2]
                         if field.endswith('.z'):
-                            value = self.decompress(value)
                             field = field.split('.')[0]
-                        await self.on_update({field: value})
+                            if field in self.topics:
+                                # Each payload is a full sample; merging would keep only the last
+                                batch.setdefault(field, []).append(CompressedTopic(value))
+                            continue
+                        if field not in self.topics:
+                            continue
+                        if field in batch:
+                            batch[field] = merge_delta(batch[field], value)
+                        else:
+                            batch[field] = value
+                if batch:
+                    if stamp and self.measure_feed_lag:
+                        self._observe_feed_lag(stamp)
+                    for field, value in batch.items():
+                        if isinstance(value, list):
+                            for sample in value:
+                                self.state.apply(field, sample)
+                        else:
+                            self.state.apply(field, value)
+                    await self.on_update(batch)
             elif 'R' in parsed and (parsed.get('I') == '1' or parsed.get('I') == 1):
                 bulk = {}
                 for f, v in parsed['R'].items():
                     if f.endswith('.z'):
-                        v = self.decompress(v)
+                        v = CompressedTopic(v)
                         f = f.split('.')[0]
-                    bulk[f] = v
+                    if f in self.topics:
+                        bulk[f] = v
+                self.state.load_snapshot(bulk)
                 await self.on_update(bulk)
         except Exception: pass
 
-    async def run(self):
-        self.loop = asyncio.get_running_loop()
-        hub_encoded = quote(f'[{{"name":"{SIGNALR_HUB}"}}]', safe='')
-        negotiate_url = f"https://livetiming.formula1.com/signalr/negotiate?connectionData={hub_encoded}&clientProtocol=1.5"
-        
+    def _observe_feed_lag(self, stamp):
+        """Upstream lag: the feed's UTC timestamp against our wall clock."""
+        try:
+            sent = datetime.fromisoformat(stamp.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            return
+        metrics.observe("f1", "feed_lag", max(0.0, time.time() - sent))
+
+    async def negotiate(self):
+        """Requests a new ConnectionToken over the shared keep-alive HTTP pool."""
+        async with http.get(self.negotiate_url, "f1") as resp:
+            resp.raise_for_status()
+            data = await resp.json(content_type=None)
+        return data.get('ConnectionToken')
+
+    async def _keep_token_ready(self):
+        """Background task: keeps a fresh ConnectionToken for the next reconnect.
+
+        Only runs while a socket is live; when there is no session the main loop
+        negotiates on its own and a standby token would just be wasted, so the task
+        sleeps until the next connection.
+        """
         while True:
+            await self._live.wait()
+            try:
+                token = await self.negotiate()
+                self._standby_token = (token, time.monotonic()) if token else None
+            except Exception:
+                self._standby_token = None
             try:
-                self.connected = False
-                self.log("[F1] Negociando con el servidor...")
-                resp = requests.get(negotiate_url, headers={'User-Agent': F1_UA})
-                token = resp.json().get('ConnectionToken')
-                if not token:
-                    self.log("[F1] No hay sesión activa. Reintentando en 60s...")
-                    await asyncio.sleep(60)
-                    continue
-
-                ws_url = (f"wss://livetiming.formula1.com/signalr/connect"
-                          f"?clientProtocol=1.5&transport=webSockets"
-                          f"&connectionToken={quote(token, safe='')}&connectionData={hub_encoded}")
-                
-                self.log("[F1] Conectando al WebSocket...")
-                async with websockets.connect(ws_url, extra_headers={"User-Agent": F1_UA}, ping_interval=None) as ws:
-                    self.connected = True
-                    self.log("[F1] Conexión establecida")
-                    
-                    await ws.send(json.dumps({
-                        "H": SIGNALR_HUB, "M": "Subscribe",
-                        "A": [['TrackStatus', 'RaceControlMessages', 'SessionInfo']], "I": "1"
-                    }))
+                await asyncio.wait_for(self._token_wanted.wait(), timeout=TOKEN_MAX_AGE / 2)
+            except asyncio.TimeoutError:
+                pass
+            self._token_wanted.clear()
+
+    async def _take_token(self):
+        """Returns the pre-negotiated token if still fresh, else negotiates now."""
+        standby, self._standby_token = self._standby_token, None
+        self._token_wanted.set()
+        if standby and time.monotonic() - standby[1] < TOKEN_MAX_AGE:
+            return standby[0]
+        self.log("[F1] Negociando con el servidor...")
+        return await self.negotiate()
+
+    async def _open_socket(self, token):
+        ws_base = "ws" + self.base_url[len("http"):]  # https -> wss, http -> ws
+        ws_url = (f"{ws_base}/signalr/connect"
+                  f"?clientProtocol=1.5&transport=webSockets"
+                  f"&connectionToken={quote(token, safe='')}&connectionData={self.hub_encoded}")
+        # Keepalive pings are sent by the watchdog; a short close_timeout keeps a
+        # half-open socket from stalling the swap to its replacement.
+        ws = await websockets.connect(ws_url, extra_headers={"User-Agent": F1_UA},
+                                      ping_interval=None, close_timeout=1)
+        try:
+            await self._send_subscribe(ws, self.topics.wire_names())
+        except BaseException:  # including a cancelled swap
+            await ws.close()
+            raise
+        return ws
+
+    def _mark_connected(self, ws):
+        self.ws = ws
+        self.connected = True
+        self._live.set()
+        self._token_wanted.set()
+        if self._blind_since is not None:
+            elapsed = time.monotonic() - self._blind_since
+            self._blind_since = None
+            self.reconnect_times.append(elapsed)
+            metrics.observe("f1", "reconnect", elapsed)
+            self.log(f"[F1] Reconexión completada en {elapsed * 1000:.0f} ms")
+
+    def request_reconnect(self):
+        """Opens a new WebSocket alongside the current one and swaps to it once subscribed.
+
+        The old socket keeps delivering frames until the new one is ready, so the
+        swap itself leaves no window without a live feed.
+        """
+        if self._swap_task and not self._swap_task.done():
+            return
+        self._swap_task = asyncio.create_task(self._swap())
+
+    async def _swap(self):
+        started = time.monotonic()
+        replacing = self.ws
+        try:
+            token = await self._take_token()
+            if not token:
+                return
+            new_ws = await self._open_socket(token)
+        except Exception as e:
+            self.log(f"[F1] No se pudo preparar la nueva conexión: {e}")
+            return
+        if self.ws is not replacing:
+            # The run loop dropped or replaced that socket meanwhile; it owns the feed now
+            await new_ws.close()
+            return
+        old_ws, self.ws = self.ws, new_ws
+        self.reconnect_times.append(time.monotonic() - started)
+        metrics.observe("f1", "reconnect", time.monotonic() - started)
+        self.log(f"[F1] Conexión renovada sin cortes en {(time.monotonic() - started) * 1000:.0f} ms")
+        if old_ws:
+            await old_ws.close()
+
+    async def _watchdog(self):
+        """Detects half-open sockets that would otherwise hang `async for msg in ws`.
+
+        Sleeps while disconnected and, while frames keep arriving, until PING_AFTER
+        seconds after the last one; it only polls every WATCHDOG_INTERVAL once the
+        socket has gone quiet.
+        """
+        while True:
+            await self._live.wait()
+            idle = self.seconds_since_last_frame()
+            if idle is None or idle < PING_AFTER:
+                await asyncio.sleep(PING_AFTER - (idle or 0))
+                continue
+            await self._check_quiet_socket(idle)
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+
+    async def _check_quiet_socket(self, idle):
+        """Pings a socket quiet for `idle` seconds and replaces it if it looks dead."""
+        ws = self.ws
+        if ws is None or not self.connected:
+            return
+        if self._swap_task and not self._swap_task.done():
+            return
+        reason = None
+        if idle >= self.stale_timeout:
+            reason = f"sin datos desde hace {idle:.0f}s"
+        else:
+            try:
+                pong = await ws.ping()
+                await asyncio.wait_for(pong, timeout=PONG_TIMEOUT)
+            except Exception:
+                reason = f"sin respuesta al ping ({idle:.0f}s sin datos)"
+        if reason and self.ws is ws:
+            self.log(f"[F1] Conexión inactiva: {reason}. Forzando reconexión...")
+            self.last_frame_at = time.monotonic()  # give the replacement a full window
+            self.request_reconnect()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self._token_wanted = asyncio.Event()
+        self._live = asyncio.Event()
+        self._standby_task = asyncio.create_task(self._keep_token_ready())
+        self._watchdog_task = asyncio.create_task(self._watchdog())
+        failures = 0
+        try:
+            while True:
+                ws = self.ws
+                try:
+                    if ws is None:
+                        self.connected = False
+                        self._live.clear()
+                        token = await self._take_token()
+                        if not token:
+                            # No session: the gap until the next one is not a reconnect
+                            self._blind_since = None
+                            await self.scheduler.wait_for_session(self.log)
+                            continue
+
+                        self.log("[F1] Conectando al WebSocket...")
+                        ws = await self._open_socket(token)
+                        self.last_frame_at = time.monotonic()
+                        self._mark_connected(ws)
+                        self.scheduler.reset()
+                        self.log("[F1] Conexión establecida")
 
+                    ws = self.ws
                     async for msg in ws:
+                        self.last_frame_at = time.monotonic()
+                        failures = 0
+                        if self.recorder:
+                            self.recorder.write(msg)
                         await self.process_message(msg)
-            except Exception as e:
-                self.connected = False
-                self.log(f"[F1 Error] {e}. Reconectando en 10s...")
-                await asyncio.sleep(10)
+                    if self.ws is not ws:
+                        continue  # swapped to a newer socket, keep reading from it
+                    raise ConnectionError("el servidor cerró la conexión")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if self.ws is not None and self.ws is not ws and self.ws.open:
+                        continue  # the failing socket had already been replaced
+                    self.connected = False
+                    self._live.clear()
+                    self.ws = None
+                    if self._swap_task:
+                        self._swap_task.cancel()  # its socket would race the reconnect below
+                    if self._blind_since is None:
+                        self._blind_since = time.monotonic()
+                    delay = RECONNECT_BACKOFF[min(failures, len(RECONNECT_BACKOFF) - 1)]
+                    failures += 1
+                    self.log(f"[F1 Error] {e}. Reconectando en {delay}s...")
+                    await asyncio.sleep(delay)
+        finally:
+            self._standby_task.cancel()
+            self._watchdog_task.cancel()
+            if self._swap_task:
+                self._swap_task.cancel()
+            if self.ws:
+                await self.ws.close()
+            self.connected = False
@@ -0,0 +1,152 @@
+"""
+Session recorder and replay for the F1 SignalR feed.
+
+Recordings are append-only text files, optionally gzip-compressed (".gz"):
+every session segment starts with a "# f1rec 1 <epoch>" header and each raw
+frame follows as "<seconds since header>\\t<frame>". SignalR frames are JSON
+and never contain raw newlines, so one line is one frame.
+
+Usage:
+    python f1_recorder.py record session.rec.gz
+    python f1_recorder.py replay session.rec.gz --speed 10
+"""
+import argparse
+import asyncio
+import gzip
+import time
+from f1_monitor import F1Monitor
+
+HEADER = "# f1rec 1"
+FLUSH_INTERVAL = 1.0
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class SessionRecorder:
+    """Appends every raw frame the monitor receives to a timestamped recording."""
+    def __init__(self, path):
+        self.path = path
+        self.frames = 0
+        self._file = _open(path, "a")
+        self._start = time.monotonic()
+        self._last_flush = self._start
+        self._file.write(f"{HEADER} {time.time():.3f}\n")
+
+    def write(self, frame):
+        now = time.monotonic()
+        self._file.write(f"{now - self._start:.3f}\t{frame}\n")
+        self.frames += 1
+        if now - self._last_flush >= FLUSH_INTERVAL:
+            self._file.flush()
+            self._last_flush = now
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def read_frames(path):
+    """Yields (offset, frame) pairs; segments appended later continue the timeline."""
+    base = 0.0
+    last = 0.0
+    with _open(path, "r") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith(HEADER):
+                base = last
+                continue
+            if not line or line.startswith("#"):
+                continue
+            offset, _, frame = line.partition("\t")
+            last = base + float(offset)
+            yield last, frame
+
+
+async def replay(path, monitor, speed=1.0):
+    """Feeds a recording into monitor.process_message.
+
+    speed scales the recorded timing (1 = real time, 10 = ten times faster);
+    0 or less replays as fast as possible.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    count = 0
+    for offset, frame in read_frames(path):
+        if speed > 0:
+            delay = start + offset / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        monitor.last_frame_at = time.monotonic()
+        await monitor.process_message(frame)
+        count += 1
+    return count
+
+
+class F1ReplayMonitor(F1Monitor):
+    """F1Monitor whose frames come from a recording instead of the live socket."""
+    def __init__(self, on_update_callback, logger, path, speed=1.0, topics=None):
+        super().__init__(on_update_callback, logger, topics)
+        self.path = path
+        self.speed = speed
+        self.measure_feed_lag = False  # recorded timestamps are in the past
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        speed = f"{self.speed:g}x" if self.speed > 0 else "máxima velocidad"
+        self.log(f"[F1] Reproduciendo {self.path} a {speed}...")
+        self.connected = True
+        started = time.perf_counter()
+        count = await replay(self.path, self, self.speed)
+        elapsed = time.perf_counter() - started
+        self.connected = False
+        self.log(f"[F1] Reproducción terminada: {count} frames en {elapsed:.2f}s")
+        # Keep the task alive so the last replayed state stays on the bulb.
+        await asyncio.Event().wait()
+
+
+async def _record(path):
+    recorder = SessionRecorder(path)
+
+    async def on_update(update):
+        pass
+
+    monitor = F1Monitor(on_update, print)
+    monitor.recorder = recorder
+    try:
+        await monitor.run()
+    finally:
+        recorder.close()
+        print(f"{recorder.frames} frames guardados en {path}")
+
+
+async def _replay(path, speed):
+    async def on_update(update):
+        print(update)
+
+    monitor = F1Monitor(on_update, print)
+    monitor.measure_feed_lag = False
+    started = time.perf_counter()
+    count = await replay(path, monitor, speed)
+    print(f"{count} frames en {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Graba o reproduce el feed de F1 Live Timing.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record")
+    rec.add_argument("path")
+    rep = sub.add_parser("replay")
+    rep.add_argument("path")
+    rep.add_argument("--speed", type=float, default=1.0, help="1 = tiempo real, 0 = lo más rápido posible")
+    args = parser.parse_args()
+    try:
+        if args.command == "record":
+            asyncio.run(_record(args.path))
+        else:
+            asyncio.run(_replay(args.path, args.speed))
+    except KeyboardInterrupt:
+        pass
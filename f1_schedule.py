@@ -0,0 +1,165 @@
+"""
+Session-aware connection scheduling for the F1 monitor.
+
+Instead of negotiating every minute forever, F1Monitor asks the scheduler how long
+to wait when there is no live session. The scheduler keeps a local cache of the
+season calendar (from the live timing Index.json plus any SessionInfo seen on the
+feed), sleeps until a few minutes before the next session and otherwise backs off
+with jitter. Clock, sleep, fetch and random source are injectable for testing.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from config import LIVETIMING_URL
+from http_client import http
+
+CALENDAR_FILE = "f1_calendar.json"
+LEAD_TIME = 300            # connect this long before a session starts
+SESSION_GRACE = 1800       # keep trying this long after the scheduled end
+WINDOW_RETRY = 15          # retry interval inside a session window
+BACKOFF_BASE = 60
+BACKOFF_MAX = 1800
+MAX_SLEEP = 6 * 3600       # re-check the calendar at least this often
+CALENDAR_MAX_AGE = 24 * 3600
+
+
+def session_bounds(session):
+    """Returns (start, end) as UTC epoch seconds for an Index.json / SessionInfo entry."""
+    offset = session.get("GmtOffset") or "00:00:00"
+    sign = -1 if offset.startswith("-") else 1
+    hours, minutes, seconds = (int(part) for part in offset.lstrip("+-").split(":"))
+    gmt_offset = sign * timedelta(hours=hours, minutes=minutes, seconds=seconds)
+
+    def to_epoch(value):
+        local = datetime.fromisoformat(value)
+        return (local - gmt_offset).replace(tzinfo=timezone.utc).timestamp()
+
+    start = to_epoch(session["StartDate"])
+    end = to_epoch(session["EndDate"]) if session.get("EndDate") else start + 2 * 3600
+    return start, end
+
+
+class SessionScheduler:
+    """Decides how long F1Monitor should sleep while no session is live."""
+    def __init__(self, calendar_file=CALENDAR_FILE, index_url=None, clock=time.time,
+                 sleep=asyncio.sleep, fetch=None, rng=random.random):
+        self.calendar_file = calendar_file
+        self.index_url = index_url or f"{LIVETIMING_URL}/static/{{year}}/Index.json"
+        self.clock = clock
+        self.sleep = sleep
+        self.fetch = fetch or self._fetch_json
+        self.rng = rng
+        self.sessions = []      # sorted (start, end, name)
+        self.fetched_at = 0
+        self.failures = 0
+        self._refresh_after = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.calendar_file):
+            return
+        try:
+            with open(self.calendar_file, "r") as f:
+                data = json.load(f)
+            self.sessions = sorted(tuple(s) for s in data.get("sessions", []))
+            self.fetched_at = data.get("fetched_at", 0)
+        except Exception:
+            self.sessions = []
+
+    def _save(self):
+        try:
+            with open(self.calendar_file, "w") as f:
+                json.dump({"fetched_at": self.fetched_at, "sessions": self.sessions}, f)
+        except Exception:
+            pass
+
+    def _add(self, start, end, name):
+        """Inserts a session; returns False if it was already in the calendar."""
+        entry = (start, end, name)
+        if entry in self.sessions:
+            return False
+        self.sessions.append(entry)
+        self.sessions.sort()
+        return True
+
+    def note_session_info(self, info):
+        """Adds the session announced on the feed (SessionInfo topic) to the calendar."""
+        try:
+            start, end = session_bounds(info)
+        except Exception:
+            return
+        meeting = (info.get("Meeting") or {}).get("Name", "")
+        # SessionInfo repeats on every subscribe; only a new session touches the disk
+        if self._add(start, end, f"{meeting} {info.get('Name', '')}".strip()):
+            self._save()
+
+    async def _fetch_json(self, url):
+        async with http.get(url, "f1") as resp:
+            resp.raise_for_status()
+            content = await resp.read()
+        # The static files start with a UTF-8 BOM.
+        return json.loads(content.decode("utf-8-sig"))
+
+    async def refresh_calendar(self):
+        now = self.clock()
+        year = datetime.fromtimestamp(now, timezone.utc).year
+        data = await self.fetch(self.index_url.format(year=year))
+        for meeting in data.get("Meetings", []):
+            for session in meeting.get("Sessions", []):
+                try:
+                    start, end = session_bounds(session)
+                except Exception:
+                    continue
+                self._add(start, end, f"{meeting.get('Name', '')} {session.get('Name', '')}".strip())
+        self.fetched_at = now
+        self._save()
+
+    def next_session(self):
+        """First session that has not finished (including the grace period), or None."""
+        now = self.clock()
+        for session in self.sessions:
+            if session[1] + SESSION_GRACE > now:
+                return session
+        return None
+
+    def reset(self):
+        """Called once a connection succeeds."""
+        self.failures = 0
+
+    def next_delay(self):
+        now = self.clock()
+        session = self.next_session()
+        if session and session[0] - LEAD_TIME <= now:
+            # Inside a session window: the token may appear any moment.
+            return WINDOW_RETRY * (0.5 + self.rng() / 2)
+        if session:
+            return min(session[0] - LEAD_TIME - now, MAX_SLEEP)
+        backoff = min(BACKOFF_BASE * 2 ** self.failures, BACKOFF_MAX)
+        self.failures += 1
+        return backoff * (0.5 + self.rng() / 2)
+
+    async def wait_for_session(self, logger=None):
+        """Sleeps until it is worth negotiating again."""
+        now = self.clock()
+        stale = now - self.fetched_at > CALENDAR_MAX_AGE
+        if (stale or self.next_session() is None) and now >= self._refresh_after:
+            # Rate-limited so an unreachable index or an empty off-season calendar
+            # is not re-fetched on every wait.
+            self._refresh_after = now + MAX_SLEEP
+            try:
+                await self.refresh_calendar()
+            except Exception as e:
+                if logger: logger(f"[F1] No se pudo actualizar el calendario: {e}")
+        session = self.next_session()
+        waiting_for_window = session is not None and session[0] - LEAD_TIME > self.clock()
+        delay = self.next_delay()
+        if logger:
+            if waiting_for_window:
+                start = datetime.fromtimestamp(session[0], timezone.utc).strftime("%d/%m %H:%M UTC")
+                logger(f"[F1] No hay sesión activa. Próxima: {session[2]} ({start}). Esperando {delay / 60:.0f} min...")
+            else:
+                logger(f"[F1] No hay sesión activa. Reintentando en {delay:.0f}s...")
+        await self.sleep(delay)
@@ -0,0 +1,133 @@
+from collections.abc import Mapping
+
+_SCALARS = (str, int, float, bool, type(None))
+
+def _own(value):
+    """Copies containers coming from the feed so later merges never mutate
+    objects that were also handed to on_update consumers."""
+    if isinstance(value, dict):
+        return {key: _own(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_own(item) for item in value]
+    return value
+
+def _split(path):
+    return tuple(path.split('.')) if isinstance(path, str) else tuple(path)
+
+class LiveState:
+    """In-memory tree of the F1 live timing topics.
+
+    The bulk `R` snapshot received after subscribing is the baseline; every feed
+    delta is merged into it touching only the keys it carries. Reads and watches
+    use dotted paths such as "SessionInfo.Meeting.Name"; list items are addressed
+    by index ("RaceControlMessages.Messages.0.Message").
+    """
+    def __init__(self):
+        self.topics = {}
+        self._watchers = {}     # watched path -> callbacks
+        self._descendants = {}  # path prefix -> watched paths below it
+
+    def load_snapshot(self, bulk):
+        """Replaces the given topics with a full snapshot."""
+        changed = []
+        for topic, value in bulk.items():
+            self.topics[topic] = _own(value)
+            changed.append((topic,))
+        self._notify(changed)
+
+    def apply(self, topic, delta):
+        """Merges a partial update into a topic and notifies the affected watchers."""
+        changed = []
+        if topic in self.topics:
+            self.topics[topic] = self._merge(self.topics[topic], delta, (topic,), changed)
+        else:
+            self.topics[topic] = _own(delta)
+            changed.append((topic,))
+        self._notify(changed)
+        return changed
+
+    def _merge(self, base, delta, path, changed):
+        if isinstance(base, dict) and isinstance(delta, dict):
+            for key, value in delta.items():
+                self._merge_item(base, key, value, path + (key,), changed)
+            return base
+        if isinstance(base, list) and isinstance(delta, dict):
+            for key, value in delta.items():
+                try:
+                    index = int(key)
+                except ValueError:
+                    continue
+                if index < len(base):
+                    self._merge_item(base, index, value, path + (str(index),), changed)
+                else:
+                    base.append(_own(value))
+                    changed.append(path + (str(len(base) - 1),))
+            return base
+        if not (isinstance(delta, _SCALARS) and base == delta):
+            changed.append(path)
+        return _own(delta)
+
+    def _merge_item(self, container, key, value, path, changed):
+        if isinstance(container, dict) and key not in container:
+            container[key] = _own(value)
+            changed.append(path)
+            return
+        current = container[key]
+        if isinstance(current, (dict, list)) and isinstance(value, dict):
+            self._merge(current, value, path, changed)
+        elif not (isinstance(value, _SCALARS) and current == value):
+            container[key] = _own(value)
+            changed.append(path)
+
+    def get(self, path, default=None):
+        """Point read of a dotted path; returns default if any part is missing."""
+        node = self.topics
+        for part in _split(path):
+            if isinstance(node, Mapping):
+                if part not in node:
+                    return default
+                node = node[part]
+            elif isinstance(node, list):
+                try:
+                    node = node[int(part)]
+                except (ValueError, IndexError):
+                    return default
+            else:
+                return default
+        return node
+
+    def watch(self, path, callback):
+        """Calls callback(path, value) whenever the value at path (or below it) changes."""
+        key = _split(path)
+        self._watchers.setdefault(key, []).append(callback)
+        for i in range(1, len(key)):
+            self._descendants.setdefault(key[:i], set()).add(key)
+
+    def unwatch(self, path, callback):
+        key = _split(path)
+        callbacks = self._watchers.get(key, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks:
+            self._watchers.pop(key, None)
+            for i in range(1, len(key)):
+                below = self._descendants.get(key[:i])
+                if below:
+                    below.discard(key)
+                    if not below:
+                        del self._descendants[key[:i]]
+
+    def _notify(self, changed):
+        if not self._watchers:
+            return
+        hit = set()
+        for path in changed:
+            for i in range(1, len(path) + 1):
+                if path[:i] in self._watchers:
+                    hit.add(path[:i])
+            hit.update(self._descendants.get(path, ()))
+        for key in hit:
+            value = self.get(key)
+            dotted = '.'.join(key)
+            for callback in list(self._watchers.get(key, ())):
+                callback(dotted, value)
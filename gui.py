@@ -2,10 +2,18 @@ import tkinter as tk
 import customtkinter as ctk
 import asyncio
 import time
+from collections import deque
 import ctypes
 import os
 import sys
 from config import COLORS, NASCAR_COLORS, MOTOGP_COLORS
+from metrics import registry as metrics
+from log_pipeline import LogRing, logger as file_log
+
+# Status changes and new log lines posted from other threads are applied on this
+# Tk tick (ms), merged into one update.
+UI_TICK_MS = 100
+QUIT = object()  # post_quit() marker in the status inbox
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -22,9 +30,16 @@ class F1FlagApp(ctk.CTk):
         self.kasa_mgr = kasa_mgr
         self.monitor_thread_loop = monitor_thread_loop
         self.current_status_code = "1"
-        self.terminal_logs = []
+        self.log_ring = LogRing()
+        self._log_rendered = 0       # next log sequence number to paint
+        self._log_lines_shown = 0
+        self._status_inbox = deque()  # post_status() handoff, drained by _tick
+        self._shown = {}              # widget -> options last passed to configure()
+        self._test_button_frames = {}  # series -> frame with its test buttons
         self.selected_series = "f1"  # "f1" or "nascar"
         self.monitor_connected = False
+        self.active_monitor = None  # set by main_logic; read for the "last frame" readout
+        self.delay_buffer = None    # set by main_logic; DELAY changes and calibration
         
         # This tells Windows to use the app's icon instead of Python's default icon
         try:
@@ -35,32 +50,41 @@ class F1FlagApp(ctk.CTk):
             pass
             
         self.title("Racing Flag Monitor")
-        icon_file = resource_path("icon.ico")
-        try:
-            from PIL import Image, ImageTk
-            import math
-            img = Image.open(icon_file)
-            if img.mode != 'RGBA':
-                img = img.convert('RGBA')
-            
-            # Windows automatically stretches rectangular icons to a square, 
-            # so we pad it with transparent pixels to be a perfect square.
-            max_dim = max(img.size)
-            square_img = Image.new("RGBA", (max_dim, max_dim), (255, 255, 255, 0))
-            offset = ((max_dim - img.size[0]) // 2, (max_dim - img.size[1]) // 2)
-            square_img.paste(img, offset)
-            
-            icon_img = ImageTk.PhotoImage(square_img)
-            self.wm_iconphoto(True, icon_img)
-            self.iconbitmap(icon_file)
-        except Exception as e:
-            print("Error parsing icon:", e)
-            self.iconbitmap(icon_file)
+        self._load_icon()
         self.geometry("800x600")
         ctk.set_appearance_mode("dark")
         
         self._setup_ui()
         self.update_status_ui()
+        self._tick_live_metrics()
+        self._tick()
+
+    def _load_icon(self):
+        """Window icon. icon.png is padded to a square at build time (build_icon.py),
+        so Tk loads it directly; PIL is only needed when it is missing."""
+        icon_file = resource_path("icon.ico")
+        try:
+            self.wm_iconphoto(True, tk.PhotoImage(file=resource_path("icon.png")))
+        except tk.TclError:
+            try:
+                from PIL import Image, ImageTk
+                img = Image.open(icon_file)
+                if img.mode != 'RGBA':
+                    img = img.convert('RGBA')
+
+                # Windows automatically stretches rectangular icons to a square,
+                # so we pad it with transparent pixels to be a perfect square.
+                max_dim = max(img.size)
+                square_img = Image.new("RGBA", (max_dim, max_dim), (255, 255, 255, 0))
+                offset = ((max_dim - img.size[0]) // 2, (max_dim - img.size[1]) // 2)
+                square_img.paste(img, offset)
+                self.wm_iconphoto(True, ImageTk.PhotoImage(square_img))
+            except Exception as e:
+                print("Error parsing icon:", e)
+        try:
+            self.iconbitmap(icon_file)
+        except tk.TclError:
+            pass  # .ico bitmaps are Windows-only
 
     def _setup_ui(self):
         self.grid_columnconfigure(0, weight=1)
@@ -106,6 +130,12 @@ class F1FlagApp(ctk.CTk):
         self.bulb_status_led = ctk.CTkLabel(self.conn_info, text="● Kasa Smart Bulb", text_color="red")
         self.bulb_status_led.pack(anchor="w", padx=10, pady=5)
 
+        self.frame_age_label = ctk.CTkLabel(self.conn_info, text="Último dato: —", font=("Inter", 11))
+        self.frame_age_label.pack(anchor="w", padx=10)
+
+        self.latency_label = ctk.CTkLabel(self.conn_info, text="Latencia p50/p95/p99: —", font=("Inter", 11))
+        self.latency_label.pack(anchor="w", padx=10)
+
         # Configuration Frame
         self.config_frame = ctk.CTkFrame(self.conn_info, fg_color="transparent")
         self.config_frame.pack(anchor="w", padx=10, pady=(10, 0), fill="x")
@@ -113,6 +143,9 @@ class F1FlagApp(ctk.CTk):
         self.settings_btn = ctk.CTkButton(self.config_frame, text="⚙️ Configuración", width=120, command=self.open_settings_window)
         self.settings_btn.pack(side="left")
 
+        self.calibrate_btn = ctk.CTkButton(self.config_frame, text="⏱ Visto en emisión", width=120, command=self.calibrate_delay)
+        self.calibrate_btn.pack(side="left", padx=(5, 0))
+
         self.log_textbox = ctk.CTkTextbox(self, height=200)
         self.log_textbox.grid(row=2, column=0, padx=20, pady=10, sticky="nsew")
         self.log_textbox.configure(state="disabled")
@@ -172,16 +205,22 @@ class F1FlagApp(ctk.CTk):
         ctk.CTkLabel(self.settings_window, text="Delay (segundos):").pack()
         delay_entry = ctk.CTkEntry(self.settings_window)
         delay_entry.pack(pady=5)
-        delay_entry.insert(0, str(config.settings.get("DELAY", 0)))
+        delay = config.settings.get("DELAY", 0)
+        if isinstance(delay, dict):
+            delay = delay.get(self.selected_series, delay.get("default", 0))
+        delay_entry.insert(0, str(delay))
         
         def save():
             new_ip = ip_entry.get()
             new_user = user_entry.get()
             new_pass = pass_entry.get()
             try:
-                new_delay = int(delay_entry.get())
+                new_delay = float(delay_entry.get())
             except ValueError:
                 new_delay = 0
+            if isinstance(config.settings.get("DELAY"), dict):
+                # Per-series delays: the entry edits the selected series
+                new_delay = dict(config.settings["DELAY"], **{self.selected_series: new_delay})
 
             config.settings["KASA_IP"] = new_ip
             config.settings["KASA_USERNAME"] = new_user
@@ -191,6 +230,8 @@ class F1FlagApp(ctk.CTk):
             
             # Update running manager
             self.kasa_mgr.update_config(new_ip, new_user, new_pass)
+            if self.delay_buffer:
+                self.monitor_thread_loop.call_soon_threadsafe(self.delay_buffer.configure, new_delay)
             self.add_log(f"Configuración guardada (IP: {new_ip})")
             self.settings_window.destroy()
             asyncio.run_coroutine_threadsafe(self._reconnect_kasa(), self.monitor_thread_loop)
@@ -201,10 +242,25 @@ class F1FlagApp(ctk.CTk):
         try:
             msg = await self.kasa_mgr.connect()
             self.add_log(msg)
-            self.update_status_ui()
         except Exception as e:
             self.add_log(str(e))
-            self.update_status_ui()
+
+    def calibrate_delay(self):
+        """Pressed when the latest flag change shows up on the stream: sets the delay."""
+        seen_at = time.monotonic()
+        if self.delay_buffer:
+            self.monitor_thread_loop.call_soon_threadsafe(self._calibrate_delay, self.selected_series, seen_at)
+
+    def _calibrate_delay(self, series, seen_at):
+        import config
+        result = self.delay_buffer.calibrate(series, seen_at)
+        if result is None:
+            self.add_log(f"[Sistema] Aún no ha llegado ninguna bandera de {series.upper()} para calibrar")
+            return
+        delay, samples = result
+        config.settings["DELAY"] = self.delay_buffer.setting()
+        config.save_settings(config.settings)
+        self.add_log(f"[Sistema] Retardo de {series.upper()} calibrado: {delay:.2f}s ({samples} marcas)")
 
     def manual_test(self, code):
         self.current_status_code = code
@@ -213,17 +269,82 @@ class F1FlagApp(ctk.CTk):
 
     def add_log(self, msg):
         timestamp = time.strftime("%H:%M:%S")
-        full_msg = f"[{timestamp}] {msg}"
-        self.terminal_logs.append(full_msg)
-        if len(self.terminal_logs) > 50: self.terminal_logs.pop(0)
-        self.after(0, self._refresh_logs)
-
-    def _refresh_logs(self):
-        self.log_textbox.configure(state="normal")
-        self.log_textbox.delete("1.0", "end")
-        self.log_textbox.insert("1.0", "\n".join(self.terminal_logs))
-        self.log_textbox.configure(state="disabled")
-        self.log_textbox.see("end")
+        # One record per text line keeps the trimming in _flush_logs exact
+        self.log_ring.append(f"[{timestamp}] {msg}".replace("\n", " "))
+        file_log.info(msg)
+
+    def post_status(self, series=None, code=None, connected=None):
+        """Safe from any thread: queues a status change for the next UI tick.
+
+        A code posted for a series that is no longer selected is ignored.
+        """
+        self._status_inbox.append((series, code, connected))
+
+    def post_quit(self):
+        """Safe from any thread: closes the window on the next UI tick."""
+        self._status_inbox.append(QUIT)
+
+    def _tick(self):
+        """Applies everything posted since the last tick in one pass, then new log lines."""
+        inbox = self._status_inbox
+        if inbox:
+            code = connected = None
+            while inbox:
+                posted = inbox.popleft()
+                if posted is QUIT:
+                    self.destroy()
+                    return
+                series, posted_code, posted_connected = posted
+                if posted_code is not None and series in (None, self.selected_series):
+                    code = posted_code
+                if posted_connected is not None:
+                    connected = posted_connected
+            if code is not None:
+                self.current_status_code = code
+            self.update_status_ui(connected)
+        else:
+            # The bulb connects and drops on the monitor loop without posting
+            self._set(self.bulb_status_led, text_color="green" if self.kasa_mgr.connected else "red")
+        self._flush_logs()
+        self.after(UI_TICK_MS, self._tick)
+
+    def _set(self, widget, **options):
+        """widget.configure() with only the options whose value changed."""
+        shown = self._shown.setdefault(widget, {})
+        changed = {key: value for key, value in options.items() if shown.get(key) != value}
+        if changed:
+            widget.configure(**changed)
+            shown.update(changed)
+
+    def _flush_logs(self):
+        """Appends the lines logged since the last tick and trims the oldest ones."""
+        lines, self._log_rendered = self.log_ring.since(self._log_rendered)
+        if not lines:
+            return
+        box = self.log_textbox
+        box.configure(state="normal")
+        box.insert("end", ("\n" if self._log_lines_shown else "") + "\n".join(lines))
+        self._log_lines_shown += len(lines)
+        excess = self._log_lines_shown - self.log_ring.size
+        if excess > 0:
+            box.delete("1.0", f"{excess + 1}.0")
+            self._log_lines_shown -= excess
+        box.configure(state="disabled")
+        box.see("end")
+
+    def _tick_live_metrics(self):
+        """Refreshes the time since the last frame and the flag-to-bulb latency readout."""
+        monitor = self.active_monitor
+        age = monitor.seconds_since_last_frame() if monitor else None
+        if age is None:
+            text = "Último dato: —"
+        elif age < 60:
+            text = f"Último dato: hace {age:.0f}s"
+        else:
+            text = f"Último dato: hace {age / 60:.0f} min"
+        self._set(self.frame_age_label, text=text)
+        self._set(self.latency_label, text=f"Latencia p50/p95/p99: {metrics.summary(self.selected_series)}")
+        self.after(1000, self._tick_live_metrics)
 
     def on_series_change(self, value):
         """Called when the series selector changes."""
@@ -246,23 +367,29 @@ class F1FlagApp(ctk.CTk):
         self.update_status_ui()
         self._update_test_buttons()
         
-        # Notify main logic to switch monitors
-        if hasattr(self, 'series_change_event') and self.series_change_event:
-            self.series_change_event.set()
+        # Notify main logic to switch monitors; the event lives on the monitor loop's thread
+        if getattr(self, 'series_change_event', None) and self.monitor_thread_loop:
+            self.monitor_thread_loop.call_soon_threadsafe(self.series_change_event.set)
     
     def _update_test_buttons(self):
-        """Update test buttons based on selected series."""
-        # Clear existing buttons
-        for widget in self.test_buttons_frame.winfo_children():
-            widget.destroy()
-        
+        """Shows the test buttons of the selected series, building them the first time."""
+        for frame in self._test_button_frames.values():
+            frame.pack_forget()
+        frame = self._test_button_frames.get(self.selected_series)
+        if frame is None:
+            frame = self._test_button_frames[self.selected_series] = self._build_test_buttons(self.selected_series)
+        frame.pack(side="left")
+
+    def _build_test_buttons(self, series):
+        frame = ctk.CTkFrame(self.test_buttons_frame, fg_color="transparent")
+
         # Get color map based on series
-        color_map = COLORS if self.selected_series == "f1" else (NASCAR_COLORS if self.selected_series == "nascar" else MOTOGP_COLORS)
+        color_map = COLORS if series == "f1" else (NASCAR_COLORS if series == "nascar" else MOTOGP_COLORS)
         
         # Select test codes based on series
-        if self.selected_series == "f1":
+        if series == "f1":
             test_codes = ["1", "2", "5", "6"]
-        elif self.selected_series == "motogp":
+        elif series == "motogp":
             test_codes = ["G", "Y", "R", "F"]
         else:
             test_codes = ["1", "2", "3", "5"]  # Green, Yellow, Red, Checkered
@@ -275,7 +402,7 @@ class F1FlagApp(ctk.CTk):
                 text_color = "black" if code in ["1", "2", "4"] else "white"
                 
                 btn = ctk.CTkButton(
-                    self.test_buttons_frame, 
+                    frame, 
                     text=label, 
                     width=100, 
                     fg_color=color_hex, 
@@ -283,6 +410,7 @@ class F1FlagApp(ctk.CTk):
                     command=lambda c=code: self.manual_test(c)
                 )
                 btn.pack(side="left", padx=5)
+        return frame
 
     def update_status_ui(self, monitor_connected=None):
         """Update the status UI with current flag state."""
@@ -294,7 +422,7 @@ class F1FlagApp(ctk.CTk):
         color_info = color_map.get(self.current_status_code, (0, 0, 0, "Desconocido", "#333333"))
         
         h, s, v, label, color_hex = color_info
-        self.track_status_text.configure(text=label, text_color=color_hex, font=("Inter", 24, "bold"))
-        self.track_status_box.configure(border_width=2, border_color=color_hex)
-        self.monitor_status_led.configure(text_color="green" if self.monitor_connected else "red")
-        self.bulb_status_led.configure(text_color="green" if self.kasa_mgr.connected else "red")
+        self._set(self.track_status_text, text=label, text_color=color_hex, font=("Inter", 24, "bold"))
+        self._set(self.track_status_box, border_width=2, border_color=color_hex)
+        self._set(self.monitor_status_led, text_color="green" if self.monitor_connected else "red")
+        self._set(self.bulb_status_led, text_color="green" if self.kasa_mgr.connected else "red")
@@ -0,0 +1,124 @@
+"""
+Shared async HTTP transport for every monitor.
+
+One aiohttp session per event loop with a keep-alive connection pool, a DNS cache
+and a single TLS context, so the F1 negotiate, the NASCAR feed and the MotoGP
+timing polls reuse warm connections instead of paying TCP + TLS on every request.
+Timeouts are per host. Every request is timed through aiohttp's TraceConfig: DNS,
+connection setup (TCP + TLS) and total time go to the metrics registry, and the
+per-host summary shows how many handshakes the pool saved.
+"""
+import asyncio
+import ssl
+import time
+import aiohttp
+from yarl import URL
+from config import F1_UA
+from metrics import registry as metrics
+
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 60
+CONNECTIONS_PER_HOST = 4
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=10, sock_connect=5)
+HOST_TIMEOUTS = {
+    "livetiming.formula1.com": aiohttp.ClientTimeout(total=10, sock_connect=5),
+    "cf.nascar.com": aiohttp.ClientTimeout(total=8, sock_connect=4),
+    "api.motogp.pulselive.com": aiohttp.ClientTimeout(total=8, sock_connect=4),
+}
+
+
+class HostStats:
+    """Connection reuse and handshake cost for one host."""
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.handshake_time = 0.0
+
+    def summary(self):
+        reused = self.requests - self.new_connections
+        if not self.new_connections:
+            return f"{self.requests} peticiones, todas por conexiones reutilizadas"
+        handshake = self.handshake_time / self.new_connections
+        return (f"{self.requests} peticiones, {reused} por conexiones reutilizadas; "
+                f"handshake medio {handshake * 1000:.0f} ms, ahorro ~{reused * handshake:.1f}s")
+
+
+class HttpClient:
+    """Lazily opens one pooled session per event loop; safe to share between monitors."""
+    def __init__(self):
+        self._session = None
+        self._loop = None
+        self._ssl = ssl.create_default_context()
+        self.hosts = {}
+
+    def session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=CONNECTIONS_PER_HOST, ttl_dns_cache=DNS_CACHE_TTL,
+                keepalive_timeout=KEEPALIVE_TIMEOUT, ssl=self._ssl,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers={"User-Agent": F1_UA},
+                timeout=DEFAULT_TIMEOUT, trace_configs=[self._trace_config()],
+            )
+            self._loop = loop
+        return self._session
+
+    def get(self, url, series, headers=None, **kwargs):
+        """session.get with the host's timeout; use as `async with http.get(...) as resp`."""
+        host = URL(url).host
+        return self.session().get(
+            url, headers=headers, timeout=HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT),
+            trace_request_ctx={"series": series}, **kwargs,
+        )
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def summary(self):
+        return "; ".join(f"{host}: {stats.summary()}" for host, stats in self.hosts.items())
+
+    def _trace_config(self):
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._on_request_start)
+        trace.on_dns_resolvehost_start.append(self._on_dns_start)
+        trace.on_dns_resolvehost_end.append(self._on_dns_end)
+        trace.on_connection_create_start.append(self._on_connect_start)
+        trace.on_connection_create_end.append(self._on_connect_end)
+        trace.on_request_end.append(self._on_request_end)
+        return trace
+
+    def _series(self, ctx):
+        # trace_request_ctx is absent for requests made on the session directly
+        return (ctx.trace_request_ctx or {}).get("series", "http")
+
+    async def _on_request_start(self, session, ctx, params):
+        ctx.started = time.monotonic()
+        ctx.host = params.url.host
+        self.hosts.setdefault(ctx.host, HostStats()).requests += 1
+
+    async def _on_dns_start(self, session, ctx, params):
+        ctx.dns_started = time.monotonic()
+
+    async def _on_dns_end(self, session, ctx, params):
+        metrics.observe_since(self._series(ctx), "http_dns", ctx.dns_started, device=params.host)
+
+    async def _on_connect_start(self, session, ctx, params):
+        ctx.connect_started = time.monotonic()
+
+    async def _on_connect_end(self, session, ctx, params):
+        elapsed = time.monotonic() - ctx.connect_started
+        stats = self.hosts.setdefault(ctx.host, HostStats())
+        stats.new_connections += 1
+        stats.handshake_time += elapsed
+        metrics.observe(self._series(ctx), "http_connect", elapsed, device=ctx.host)
+
+    async def _on_request_end(self, session, ctx, params):
+        metrics.observe_since(self._series(ctx), "http", ctx.started, device=ctx.host)
+
+
+# Shared by all monitors.
+http = HttpClient()
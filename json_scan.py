@@ -0,0 +1,157 @@
+"""
+Incremental scanner that pulls top-level scalar fields out of a streamed JSON object
+without building the rest of it.
+
+Nested objects and arrays are skipped almost entirely in C: each chunk is reduced to
+its brackets and quotes with bytes.translate, quoted pairs are dropped, and only the
+remaining brackets are counted in Python. The chunk where the container closes is
+then walked bracket by bracket to find its end. Scanning stops as soon as every
+wanted field has been seen.
+"""
+import json
+import re
+
+WHITESPACE = re.compile(rb"[ \t\n\r,]*")
+STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+SCALAR = re.compile(rb"[^,}\]\s]+")
+ESCAPE = re.compile(rb"\\.", re.S)
+STRING_REST = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*')
+QUOTED = re.compile(rb'"[^"]*"')
+NOT_STRUCTURAL = bytes(set(range(256)) - set(b'[]{}"'))
+# Everything up to and including the next bracket, with whole strings jumped over.
+UNTIL_BRACKET = re.compile(rb'(?:[^\[\]{}"]+|"[^"\\]*(?:\\.[^"\\]*)*")*[\[\]{}]', re.S)
+OPENERS = frozenset(b"[{")
+
+
+class TopLevelScanner:
+    """Feed it chunks of a JSON object; `found` fills with the wanted scalar fields.
+
+    feed() returns True once every wanted field was found or the object ended.
+    Wanted fields whose value is an object or array are skipped like any other.
+    """
+    def __init__(self, fields):
+        self.wanted = set(fields)
+        self.found = {}
+        self.done = False
+        self.bytes_scanned = 0
+        self._buf = b""
+        self._state = "start"
+        self._key = None
+        self._depth = 0
+        self._in_string = False      # skipping: a string continues from the last chunk
+        self._escape = False         # ...and its last byte was a lone backslash
+
+    def feed(self, chunk):
+        if self.done:
+            return True
+        self.bytes_scanned += len(chunk)
+        buf = self._buf + chunk if self._buf else chunk
+        pos = self._scan(buf)
+        self._buf = buf[pos:]
+        return self.done
+
+    def _scan(self, buf):
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            if self._state == "skip":
+                pos = self._skip(buf, pos)
+                if self._state == "skip":
+                    break
+                continue
+
+            pos = WHITESPACE.match(buf, pos).end()
+            if pos >= end:
+                break
+            char = buf[pos:pos + 1]
+
+            if self._state == "start":
+                if char != b"{":
+                    raise ValueError("El JSON no es un objeto")
+                self._state = "key"
+                pos += 1
+            elif self._state == "key":
+                if char == b"}":
+                    self.done = True
+                    return pos + 1
+                match = STRING.match(buf, pos)
+                if not match:
+                    break
+                colon = WHITESPACE.match(buf, match.end()).end()
+                if colon >= end:
+                    break
+                if buf[colon:colon + 1] != b":":
+                    raise ValueError("Se esperaba ':' tras la clave")
+                self._key = json.loads(match.group())
+                self._state = "value"
+                pos = colon + 1
+            elif self._state == "value":
+                if char in b"[{":
+                    self._state = "skip"
+                    self._depth = 1
+                    pos += 1
+                    continue
+                match = (STRING if char == b'"' else SCALAR).match(buf, pos)
+                # A scalar that touches the end of the buffer may still be growing.
+                if not match or (char != b'"' and match.end() >= end):
+                    break
+                if self._key in self.wanted:
+                    self.found[self._key] = json.loads(match.group())
+                    if len(self.found) == len(self.wanted):
+                        self.done = True
+                        return match.end()
+                self._state = "key"
+                pos = match.end()
+        return pos
+
+    def _skip(self, buf, pos):
+        """Advances through a nested container; returns where scanning continues."""
+        end = len(buf)
+        if self._escape:
+            pos += 1
+            self._escape = False
+        if self._in_string:
+            pos = STRING_REST.match(buf, pos).end()
+            if pos >= end or buf[pos:pos + 1] == b"\\":
+                self._escape = pos < end
+                return end
+            pos += 1
+            self._in_string = False
+
+        reduced = buf[pos:]
+        if b"\\" in reduced:
+            reduced = ESCAPE.sub(b"", reduced)
+            if reduced.endswith(b"\\"):
+                self._escape = True
+                reduced = reduced[:-1]
+        reduced = reduced.translate(None, NOT_STRUCTURAL).replace(b'""', b"")
+        if b'"' in reduced:
+            reduced = QUOTED.sub(b"", reduced)
+            partial = reduced.find(b'"')
+            if partial >= 0:
+                # A string runs past the end of the chunk.
+                self._in_string = True
+                reduced = reduced[:partial]
+
+        depth = self._depth
+        for count, char in enumerate(reduced, 1):
+            depth += 1 if char in OPENERS else -1
+            if depth == 0:
+                # Closes in this chunk: walk to the closing bracket.
+                for _, match in zip(range(count), UNTIL_BRACKET.finditer(buf, pos)):
+                    pos = match.end()
+                self._depth = 0
+                self._in_string = self._escape = False
+                self._state = "key"
+                return pos
+        self._depth = depth
+        return end
+
+
+def scan_fields(chunks, fields):
+    """Scans an iterable of byte chunks; returns (found fields, bytes scanned)."""
+    scanner = TopLevelScanner(fields)
+    for chunk in chunks:
+        if scanner.feed(chunk):
+            break
+    return scanner.found, scanner.bytes_scanned
@@ -1,86 +1,377 @@
-from kasa import Discover
-from config import COLORS, NASCAR_COLORS
+import asyncio
+import json
+import os
+import time
+from config import COLORS, NASCAR_COLORS, MOTOGP_COLORS, KASA_GROUPS
+from metrics import registry as metrics
+from light_effects import EffectEngine
 
-class KasaManager:
-    """Manages the connection and control of the Kasa smart bulb."""
+SERIES_COLORS = {"f1": COLORS, "nascar": NASCAR_COLORS, "motogp": MOTOGP_COLORS}
+# A slow or offline bulb is not waited for longer than this; its own writer keeps going.
+DEVICE_TIMEOUT = 5
+# Connection parameters (device family, protocol, encryption...) of every bulb that
+# was discovered once, so later connects can skip discovery.
+DISCOVERY_CACHE_FILE = "kasa_devices.json"
+
+class _Superseded:
+    """Result of a color write that a newer target replaced before it was sent.
+
+    Falsy, so callers that only act on a confirmed change (metrics, effects) skip it.
+    """
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "SUPERSEDED"
+
+SUPERSEDED = _Superseded()
+
+def _kasa():
+    """python-kasa is imported on first use: it is by far the slowest import of the app."""
+    import kasa
+    return kasa
+
+def load_discovery_cache():
+    if os.path.exists(DISCOVERY_CACHE_FILE):
+        try:
+            with open(DISCOVERY_CACHE_FILE, "r") as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {}
+
+def save_discovery_cache(cache):
+    try:
+        with open(DISCOVERY_CACHE_FILE, "w") as f:
+            json.dump(cache, f, indent=4)
+    except Exception:
+        pass
+
+def _config_to_dict(config):
+    """DeviceConfig as a dict without credentials (they stay in settings.json)."""
+    try:
+        data = config.to_dict(exclude_credentials=True)
+    except TypeError:
+        data = config.to_dict()
+    for key in ("credentials", "credentials_hash", "http_client", "aes_keys"):
+        data.pop(key, None)
+    return data
+
+discovery_cache = load_discovery_cache()
+
+class KasaDevice:
+    """One bulb or strip: a persistent connection with its own single writer.
+
+    Requests that arrive while a write is in flight collapse into the latest target,
+    and a shadow copy of the last confirmed HSV and power state lets redundant
+    writes be skipped. Must be used from the loop that owns the KasaManager.
+    """
     def __init__(self, ip, username, password):
         self.ip = ip
+        # "host:port" addresses a device (or kasa_simulator.py) on a non-default port
+        host, _, port = ip.partition(":")
+        self.host = host
+        self.port = int(port) if port else None
         self.username = username
         self.password = password
         self.device = None
         self.connected = False
-        self.current_series = "f1"  # "f1" or "nascar"
+        self.shadow_hsv = None   # last (h, s, v) the bulb confirmed
+        self.shadow_on = None    # last power state the bulb confirmed
+        self.last_latency = None
+        self.reset_loop()
 
-    def update_config(self, ip, username, password):
-        self.ip = ip
-        self.username = username
-        self.password = password
-        self.connected = False
-        self.device = None
+    def reset_loop(self):
+        self._pending = None     # latest target not yet written: (hsv, label, series, logger, waiters)
+        self._wake = asyncio.Event()
+        self._writer = None
+        self._connect_lock = asyncio.Lock()
 
-    def update_ip(self, new_ip):
-        self.ip = new_ip
+    def forget(self):
         self.connected = False
         self.device = None
+        self.shadow_hsv = None
+        self.shadow_on = None
 
-    def set_series(self, series):
-        """Set the current racing series: 'f1' or 'nascar'"""
-        self.current_series = series.lower()
+    async def connect(self, series="f1"):
+        async with self._connect_lock:
+            # A flag that arrived during the startup connect just waits for it
+            if self.connected and self.device:
+                return f"Bombilla conectada: {self.device.alias}"
+            return await self._connect(series)
 
-    async def connect(self):
+    async def _connect(self, series):
+        started = time.monotonic()
+        if self.device is not None:
+            try:
+                await self.device.disconnect()
+            except Exception:
+                pass  # the old connection is being replaced anyway
         try:
-            self.device = await Discover.discover_single(
-                self.ip, username=self.username, password=self.password
-            )
-            await self.device.update()
+            self.device, source = None, "descubrimiento"
+            cached = discovery_cache.get(self.ip)
+            if cached:
+                try:
+                    self.device, source = await self._connect_direct(cached), "caché"
+                except Exception:
+                    # Stale entry (firmware update, new device on the same IP...)
+                    discovery_cache.pop(self.ip, None)
+            if self.device is None:
+                self.device = await _kasa().Discover.discover_single(
+                    self.host, port=self.port, username=self.username, password=self.password
+                )
+                await self.device.update()
+                discovery_cache[self.ip] = _config_to_dict(self.device.config)
+                save_discovery_cache(discovery_cache)
             if not self.device.is_on:
                 await self.device.turn_on()
             self.connected = True
-            return f"Bombilla conectada: {self.device.alias}"
+            self.shadow_on = True
+            self.shadow_hsv = self._read_hsv()
+            elapsed = time.monotonic() - started
+            stage = "kasa_connect" if source == "caché" else "kasa_discover"
+            metrics.observe(series, stage, elapsed, device=self.ip)
+            return f"Bombilla conectada: {self.device.alias} ({source}, {elapsed * 1000:.0f} ms)"
         except Exception as e:
-            self.connected = False
-            raise Exception(f"No se pudo conectar a la bombilla: {e}")
+            self.forget()
+            raise Exception(f"No se pudo conectar a la bombilla {self.ip}: {e}")
+
+    async def _connect_direct(self, cached):
+        """Connects with the saved connection parameters; Device.connect also runs update()."""
+        kasa = _kasa()
+        config = kasa.DeviceConfig.from_dict(cached)
+        if self.username or self.password:
+            config.credentials = kasa.Credentials(self.username, self.password)
+        return await kasa.Device.connect(config=config)
+
+    def _light(self):
+        if hasattr(self.device, "modules") and "light" in self.device.modules:
+            return self.device.modules["light"]
+        return self.device
 
-    async def set_color(self, status_code, logger=None):
+    def _read_hsv(self):
+        try:
+            h, s, v = self._light().hsv
+            return (h, s, v)
+        except Exception:
+            return None
+
+    async def set_hsv(self, hsv, label, series, logger=None):
+        """Queues a target and waits until it is applied.
+
+        Returns SUPERSEDED if a newer target replaces it before the writer gets to it.
+        """
+        done = asyncio.get_running_loop().create_future()
+        if self._pending:
+            for waiter in self._pending[4]:
+                if not waiter.done():
+                    waiter.set_result(SUPERSEDED)
+        self._pending = (hsv, label, series, logger, [done])
+        self._wake.set()
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+        return await done
+
+    async def _write_loop(self):
+        """Single writer: always applies the most recent target, dropping superseded ones."""
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            if self._pending is None:
+                continue
+            hsv, label, series, logger, waiters = self._pending
+            self._pending = None
+            try:
+                ok = await self._apply(hsv, label, series, logger)
+            except Exception:
+                ok = False
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(ok)
+
+    async def _apply(self, hsv, label, series, logger):
         # Try to connect if not connected
         if not self.connected or not self.device:
             try:
-                await self.connect()
-                if logger: logger("[Kasa] Reconectando...")
+                if logger and not self._connect_lock.locked():
+                    logger(f"[Kasa] Reconectando {self.ip}...")
+                await self.connect(series)
             except Exception as e:
                 if logger: logger(f"[Kasa] No se pudo conectar: {e}")
-                return
-        
-        if not self.device:
-            if logger: logger("[Kasa] Dispositivo no disponible")
-            return
-        
+                return False
+
+        h, s, v = hsv
+        if self.shadow_on and self.shadow_hsv == hsv:
+            return True
+
+        started = time.monotonic()
+        try:
+            # Ensure device is on
+            if not self.shadow_on:
+                await self.device.turn_on()
+                self.shadow_on = True
+            # Set color using HSV; the shadow replaces the follow-up update() round trip
+            await self._light().set_hsv(h, s, v)
+            self.shadow_hsv = hsv
+            self.last_latency = time.monotonic() - started
+            metrics.observe(series, "kasa", self.last_latency, device=self.ip)
+            return True
+        except Exception as e:
+            if logger: logger(f"[Kasa Error] Error al cambiar color en {self.ip}: {e}")
+            self.forget()
+            return False
+
+class KasaManager:
+    """Manages the connection and control of the Kasa smart bulbs.
+
+    The primary bulb is KASA_IP; KASA_GROUPS in settings.json adds named groups of
+    extra devices ({"salon": ["192.168.1.20", "192.168.1.21"]}). A flag change is
+    sent to every device concurrently, each through its own writer, so one slow or
+    offline device never delays the others.
+    """
+    def __init__(self, ip, username, password, groups=None):
+        self.username = username
+        self.password = password
+        self.current_series = "f1"  # "f1", "nascar" or "motogp"
+        self.loop = None
+        self.groups = KASA_GROUPS if groups is None else groups
+        self.primary = KasaDevice(ip, username, password)
+        self.devices = {}
+        self._build_devices()
+        self.effects = EffectEngine(self)
+
+    def _build_devices(self):
+        devices = {self.primary.ip: self.primary} if self.primary.ip else {}
+        for ips in self.groups.values():
+            for ip in ips:
+                if ip not in devices:
+                    devices[ip] = self.devices.get(ip) or KasaDevice(ip, self.username, self.password)
+        self.devices = devices
+
+    @property
+    def ip(self):
+        return self.primary.ip
+
+    @property
+    def connected(self):
+        return any(device.connected for device in self.devices.values())
+
+    def update_config(self, ip, username, password):
+        self.username = username
+        self.password = password
+        for device in self.devices.values():
+            device.username, device.password = username, password
+            device.forget()
+        self.update_ip(ip)
+
+    def update_ip(self, new_ip):
+        self.primary = KasaDevice(new_ip, self.username, self.password)
+        self.devices.pop(new_ip, None)
+        self._build_devices()
+
+    def set_series(self, series):
+        """Set the current racing series: 'f1', 'nascar' or 'motogp'"""
+        self.current_series = series.lower()
+
+    def colors_for(self, series):
+        return SERIES_COLORS.get(series, COLORS)
+
+    def _targets(self, group=None):
+        if group is None:
+            return list(self.devices.values())
+        return [self.devices[ip] for ip in self.groups.get(group, []) if ip in self.devices]
+
+    def _on_other_loop(self):
+        """True when called from a thread/loop other than the one that owns the bulbs."""
+        current = asyncio.get_running_loop()
+        if self.loop is None or self.loop.is_closed() or not self.loop.is_running():
+            if self.loop is not current:
+                self.loop = current
+                for device in self.devices.values():
+                    device.reset_loop()
+            return False
+        return self.loop is not current
+
+    async def _run_on_owner(self, coro):
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def connect(self):
+        if self._on_other_loop():
+            return await self._run_on_owner(self.connect())
+        devices = list(self.devices.values())
+        if not devices:
+            raise Exception("No se pudo conectar a la bombilla: no hay ninguna IP configurada")
+        # Import python-kasa off the loop so the monitor keeps running meanwhile.
+        await asyncio.to_thread(_kasa)
+        results = await asyncio.gather(*(d.connect(self.current_series) for d in devices),
+                                       return_exceptions=True)
+        errors = [str(r) for r in results if isinstance(r, Exception)]
+        if len(errors) == len(results):
+            raise Exception("; ".join(errors))
+        messages = [r for r in results if not isinstance(r, Exception)]
+        return "; ".join(messages + errors)
+
+    async def set_color(self, status_code, logger=None, series=None, group=None):
+        """Applies the color for a flag code, then its effect if one is declared.
+
+        Returns True once a bulb confirmed the base color, or SUPERSEDED (falsy) when
+        a newer color replaced it before it was sent.
+        """
+        if self._on_other_loop():
+            return await self._run_on_owner(self.set_color(status_code, logger, series, group))
+        series = (series or self.current_series).lower()
         # Convert to string if needed
         code_str = str(status_code) if status_code is not None else None
-        
-        # Get color info based on current series
-        if self.current_series == "nascar":
-            color_info = NASCAR_COLORS.get(code_str)
-        else:
-            color_info = COLORS.get(code_str)
-        
-        if color_info:
-            h, s, v, label, _ = color_info
+        color_info = self.colors_for(series).get(code_str)
+        if not color_info:
+            if logger: logger(f"[Kasa] Código de bandera no reconocido: {code_str} (serie: {series})")
+            return False
+        h, s, v, label, _ = color_info
+        generation = self.effects.stop()
+        ok = await self._fan_out(h, s, v, label, logger, series, group)
+        # A newer color may have been requested while this one was being written.
+        if ok and self.effects.generation == generation:
+            self.effects.start(self.loop, series, code_str, (h, s, v), group, logger)
+        return ok
+
+    async def set_hsv(self, h, s, v, label=None, logger=None, series=None, group=None):
+        """Sends an HSV target to every device (or one group) at once, ending any effect."""
+        if self._on_other_loop():
+            return await self._run_on_owner(self.set_hsv(h, s, v, label, logger, series, group))
+        self.effects.stop()
+        return await self._fan_out(h, s, v, label, logger, series, group)
+
+    async def _fan_out(self, h, s, v, label=None, logger=None, series=None, group=None):
+        series = series or self.current_series
+        targets = self._targets(group)
+        if not targets:
+            if logger: logger("[Kasa] Dispositivo no disponible")
+            return False
+
+        started = time.monotonic()
+        finished = {}
+
+        async def send(device):
             try:
-                # Ensure device is on
-                if not self.device.is_on:
-                    await self.device.turn_on()
-                    await self.device.update()
-                
-                # Set color using HSV
-                if hasattr(self.device, "modules") and "light" in self.device.modules:
-                    await self.device.modules["light"].set_hsv(h, s, v)
-                else:
-                    await self.device.set_hsv(h, s, v)
-                await self.device.update()
-                if logger: logger(f"[Kasa] Color cambiado a {label} (HSV: {h}, {s}, {v})")
-            except Exception as e:
-                if logger: logger(f"[Kasa Error] Error al cambiar color: {e}")
-                self.connected = False
-        else:
-            if logger: logger(f"[Kasa] Código de bandera no reconocido: {code_str} (serie: {self.current_series})")
+                ok = await asyncio.wait_for(device.set_hsv((h, s, v), label, series, logger), DEVICE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if logger: logger(f"[Kasa] {device.ip} no respondió en {DEVICE_TIMEOUT}s")
+                ok = False
+            if ok is True:
+                finished[device.ip] = time.monotonic() - started
+            return ok
+
+        results = await asyncio.gather(*(send(device) for device in targets))
+        if finished and logger:
+            slowest = max(finished, key=finished.get)
+            if len(targets) == 1:
+                logger(f"[Kasa] Color cambiado a {label or 'HSV'} (HSV: {h}, {s}, {v})")
+            else:
+                skew = max(finished.values()) - min(finished.values())
+                metrics.observe(series, "kasa_skew", skew)
+                logger(f"[Kasa] Color cambiado a {label or 'HSV'} en {len(finished)}/{len(targets)} "
+                       f"dispositivos (desfase {skew * 1000:.0f} ms, más lento: {slowest} "
+                       f"{finished[slowest] * 1000:.0f} ms)")
+        if any(results):
+            return True
+        return SUPERSEDED if SUPERSEDED in results else False
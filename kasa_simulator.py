@@ -0,0 +1,208 @@
+"""
+Local stand-in for a TP-Link Kasa color bulb, for offline latency and throughput tests.
+
+It speaks the legacy IOT protocol python-kasa uses for Kasa bulbs: XOR-obfuscated
+JSON over TCP with a 4-byte length prefix, plus the UDP discovery probe on the
+same port number (9999 by default; python-kasa probes the port it is given). Response latency, packet loss and disconnects are configurable and every
+command received is recorded. The Tapo/KLAP protocols (encrypted sessions) are not
+simulated.
+
+Usage:
+    python kasa_simulator.py --host 127.0.0.1 --port 9999 --latency 0.05 --loss 0.01
+and point KASA_IP at "127.0.0.1" (or "127.0.0.1:<port>" for a non-default port).
+"""
+import argparse
+import asyncio
+import json
+import random
+import struct
+import time
+
+XOR_KEY = 171
+DISCOVERY_PORT = 9999
+
+
+def xor_encrypt(payload):
+    key = XOR_KEY
+    out = bytearray()
+    for byte in payload:
+        key ^= byte
+        out.append(key)
+    return bytes(out)
+
+
+def xor_decrypt(payload):
+    key = XOR_KEY
+    out = bytearray()
+    for byte in payload:
+        out.append(key ^ byte)
+        key = byte
+    return bytes(out)
+
+
+class SimulatedBulb:
+    """A fake KL130 color bulb.
+
+    latency: seconds added before every response (plus up to `jitter` random seconds)
+    loss:    probability that a request gets no response at all
+    disconnect_rate: probability that the connection is closed instead of answered
+    """
+    LIGHT_SERVICE = "smartlife.iot.smartbulb.lightingservice"
+
+    def __init__(self, host="127.0.0.1", port=9999, latency=0.0, jitter=0.0, loss=0.0,
+                 disconnect_rate=0.0, alias="Bombilla simulada", seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.disconnect_rate = disconnect_rate
+        self.alias = alias
+        self.random = random.Random(seed)
+        self.commands = []  # (time.monotonic(), request dict)
+        self.light_state = {"on_off": 1, "mode": "normal", "hue": 0, "saturation": 0,
+                            "color_temp": 2700, "brightness": 100}
+        self._server = None
+        self._discovery = None
+        self._writers = set()
+
+    def sysinfo(self):
+        return {
+            "sw_ver": "1.8.11 Build 191113 Rel.105336", "hw_ver": "2.0",
+            "model": "KL130(US)", "description": "Smart Wi-Fi LED Bulb with Color Changing",
+            "alias": self.alias, "mic_type": "IOT.SMARTBULB", "dev_state": "normal",
+            "mic_mac": "50C7BF000001", "deviceId": "SIM0000000000000000000000000000000000001",
+            "oemId": "SIM00000000000000000000000000001", "hwId": "SIM00000000000000000000000000001",
+            "is_factory": False, "disco_ver": "1.0", "ctrl_protocols": {"name": "Linkie", "version": "1.0"},
+            "active_mode": "none", "is_dimmable": 1, "is_color": 1, "is_variable_color_temp": 1,
+            "light_state": dict(self.light_state), "preferred_state": [], "rssi": -50,
+            "err_code": 0,
+        }
+
+    def handle(self, request):
+        """Answers one decoded request the way the bulb firmware would."""
+        response = {}
+        for module, methods in request.items():
+            response[module] = {}
+            for method, params in methods.items():
+                response[module][method] = self._call(module, method, params or {})
+        return response
+
+    def _call(self, module, method, params):
+        if module == "system" and method == "get_sysinfo":
+            return self.sysinfo()
+        if module == self.LIGHT_SERVICE and method == "get_light_state":
+            return dict(self.light_state, err_code=0)
+        if module == self.LIGHT_SERVICE and method == "transition_light_state":
+            for key in ("on_off", "hue", "saturation", "brightness", "color_temp"):
+                if key in params:
+                    self.light_state[key] = params[key]
+            return dict(self.light_state, err_code=0)
+        if module == "smartlife.iot.common.timesetting" and method == "get_time":
+            now = time.localtime()
+            return {"year": now.tm_year, "month": now.tm_mon, "mday": now.tm_mday, "hour": now.tm_hour,
+                    "min": now.tm_min, "sec": now.tm_sec, "err_code": 0}
+        if module == "smartlife.iot.common.timesetting" and method == "get_timezone":
+            return {"index": 39, "err_code": 0}
+        if module == "smartlife.iot.common.cloud" and method == "get_info":
+            return {"binded": 0, "cld_connection": 0, "server": "", "username": "", "err_code": 0}
+        if module == "system" and method == "set_dev_alias":
+            self.alias = params.get("alias", self.alias)
+            return {"err_code": 0}
+        return {"err_code": -1, "err_msg": "module not support"}
+
+    async def _serve_client(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                header = await reader.readexactly(4)
+                length = struct.unpack(">I", header)[0]
+                request = json.loads(xor_decrypt(await reader.readexactly(length)))
+                self.commands.append((time.monotonic(), request))
+                delay = self.latency + self.random.random() * self.jitter
+                if delay:
+                    await asyncio.sleep(delay)
+                if self.random.random() < self.disconnect_rate:
+                    break
+                if self.random.random() < self.loss:
+                    continue
+                payload = json.dumps(self.handle(request)).encode()
+                writer.write(struct.pack(">I", len(payload)) + xor_encrypt(payload))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    class _Discovery(asyncio.DatagramProtocol):
+        def __init__(self, bulb):
+            self.bulb = bulb
+
+        def connection_made(self, transport):
+            self.transport = transport
+
+        def datagram_received(self, data, addr):
+            try:
+                request = json.loads(xor_decrypt(data))
+            except Exception:
+                return  # e.g. the encrypted 20002 probe of newer devices
+            payload = json.dumps(self.bulb.handle(request)).encode()
+            self.transport.sendto(xor_encrypt(payload), addr)
+
+    async def start(self, discovery=True):
+        loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._serve_client, self.host, self.port)
+        if self.port == 0:
+            self.port = self._server.sockets[0].getsockname()[1]
+        if discovery:
+            self._discovery, _ = await loop.create_datagram_endpoint(
+                lambda: self._Discovery(self), local_addr=(self.host, self.port))
+        return self
+
+    def disconnect_all(self):
+        """Drops every open client connection, as a Wi-Fi blip would."""
+        for writer in list(self._writers):
+            writer.close()
+
+    async def stop(self):
+        self.disconnect_all()
+        await asyncio.sleep(0)  # let the client handlers finish before the server goes away
+        if self._discovery:
+            self._discovery.close()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    @property
+    def address(self):
+        return self.host if self.port == DISCOVERY_PORT else f"{self.host}:{self.port}"
+
+
+async def _main(args):
+    bulb = await SimulatedBulb(args.host, args.port, args.latency, args.jitter, args.loss,
+                               args.disconnect_rate).start()
+    print(f"Bombilla simulada escuchando en {bulb.host}:{bulb.port} (KASA_IP={bulb.address})")
+    try:
+        last = 0
+        while True:
+            await asyncio.sleep(1)
+            if len(bulb.commands) != last:
+                last = len(bulb.commands)
+                print(f"{last} comandos recibidos. Estado: {bulb.light_state}")
+    finally:
+        await bulb.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador local de bombilla Kasa (protocolo IOT/XOR).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos por respuesta")
+    parser.add_argument("--jitter", type=float, default=0.0, help="segundos aleatorios extra por respuesta")
+    parser.add_argument("--loss", type=float, default=0.0, help="probabilidad de no responder")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="probabilidad de cortar la conexión")
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,125 @@
+import math
+from config import EFFECTS
+from metrics import registry as metrics
+
+# Effect frames are never sent faster than this, whatever the bulb measures.
+MIN_FRAME_INTERVAL = 0.1
+# Frame interval used until a bulb round trip has been measured.
+DEFAULT_FRAME_INTERVAL = 0.3
+# Headroom over the measured median round trip, so frames do not queue up.
+RATE_HEADROOM = 1.25
+
+
+def _pulse(t, hsv, params, colors):
+    """Brightness breathes between `min` and the flag's own brightness."""
+    h, s, v = hsv
+    low = params.get("min", max(1, v // 4))
+    phase = (1 + math.cos(2 * math.pi * t / params.get("period", 2.0))) / 2
+    return (h, s, round(low + (v - low) * phase)), False
+
+
+def _strobe(t, hsv, params, colors):
+    """Square wave between the flag's brightness and `min`."""
+    h, s, v = hsv
+    period = params.get("period", 0.6)
+    on = (t % period) < period * params.get("duty", 0.5)
+    return (h, s, v if on else params.get("min", 1)), False
+
+
+def _fade(t, hsv, params, colors):
+    """Linear fade to the color of another code of the same series, then holds it."""
+    target = colors.get(str(params.get("to")))
+    if not target:
+        return hsv, True
+    progress = min(1.0, t / params.get("duration", 3.0))
+    h0, s0, v0 = hsv
+    h1, s1, v1 = target[:3]
+    dh = (h1 - h0 + 180) % 360 - 180  # shortest way around the hue circle
+    frame = (round(h0 + dh * progress) % 360, round(s0 + (s1 - s0) * progress),
+             round(v0 + (v1 - v0) * progress))
+    return frame, progress >= 1.0
+
+
+EFFECT_TYPES = {"pulse": _pulse, "strobe": _strobe, "fade": _fade}
+
+
+class EffectEngine:
+    """Runs the timed light effect declared for the current flag (config.EFFECTS).
+
+    Frames are scheduled with loop.call_at on the loop that owns the KasaManager,
+    anchored to the effect start so timing does not drift. The frame rate is capped
+    by the slowest target's median round trip, and a frame is skipped while the
+    previous one is still being written. stop() is synchronous: it cancels the next
+    frame immediately, and the bulb writers order any write in flight before the
+    next flag's color.
+    """
+    def __init__(self, manager, effects=None):
+        self.manager = manager
+        self.effects = EFFECTS if effects is None else effects
+        self.current = None      # (series, code) of the running effect
+        self._handle = None
+        self._inflight = None
+        self.generation = 0      # bumped by every stop(); stale frames check it
+
+    def effect_for(self, series, code):
+        params = self.effects.get(series, {}).get(str(code))
+        if params and params.get("type") in EFFECT_TYPES:
+            return params
+        return None
+
+    def frame_interval(self, series, targets):
+        """Seconds between frames: what the slowest target bulb can sustain."""
+        medians = [metrics.percentiles(series, "kasa", device.ip)[0.5] for device in targets]
+        medians = [m for m in medians if m is not None]
+        if not medians:
+            return DEFAULT_FRAME_INTERVAL
+        return max(MIN_FRAME_INTERVAL, max(medians) * RATE_HEADROOM)
+
+    def start(self, loop, series, code, hsv, group=None, logger=None):
+        """Starts the effect for a flag, if one is declared; returns True if it started."""
+        self.stop()
+        params = self.effect_for(series, code)
+        if not params:
+            return False
+        targets = self.manager._targets(group)
+        if not targets:
+            return False
+        self.current = (series, str(code))
+        generation = self.generation
+        interval = self.frame_interval(series, targets)
+        start = loop.time()
+        if logger:
+            logger(f"[Kasa] Efecto {params['type']} activo ({1 / interval:.1f} cambios/s como máximo)")
+        self._schedule(loop, generation, start, 1, interval, series, hsv, params, group)
+        return True
+
+    def stop(self):
+        """Cancels the running effect; returns the new generation."""
+        self.generation += 1
+        self.current = None
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        if self._inflight and not self._inflight.done():
+            self._inflight.cancel()
+        self._inflight = None
+        return self.generation
+
+    def _schedule(self, loop, generation, start, index, interval, series, hsv, params, group):
+        self._handle = loop.call_at(start + index * interval, self._frame, loop, generation,
+                                    start, index, interval, series, hsv, params, group)
+
+    def _frame(self, loop, generation, start, index, interval, series, hsv, params, group):
+        if generation != self.generation:
+            return
+        colors = self.manager.colors_for(series)
+        frame, finished = EFFECT_TYPES[params["type"]](loop.time() - start, hsv, params, colors)
+        if self._inflight is None or self._inflight.done():
+            self._inflight = loop.create_task(self.manager._fan_out(*frame, series=series, group=group))
+            if finished:
+                self._handle = None
+                self.current = None
+                return
+        # Busy or not finished: next slot, skipping missed ones instead of bursting.
+        index = max(index + 1, int((loop.time() - start) / interval) + 1)
+        self._schedule(loop, generation, start, index, interval, series, hsv, params, group)
@@ -0,0 +1,61 @@
+"""
+Log plumbing shared by the desktop app and the daemon.
+
+LogRing keeps the last LOG_LINES lines with sequence numbers, so the GUI can render
+only what it has not shown yet, in batches. The log file is written by a
+QueueListener thread through a RotatingFileHandler: callers only enqueue a record,
+so a slow disk never blocks the event loop or Tk.
+"""
+import itertools
+import logging
+import logging.handlers
+import queue
+import threading
+from collections import deque
+from config import LOG_FILE, LOG_MAX_BYTES, LOG_BACKUPS, LOG_LINES
+
+logger = logging.getLogger("f1flag")
+
+
+class LogRing:
+    """Bounded (sequence, line) buffer; append() is safe from any thread."""
+    def __init__(self, size=LOG_LINES):
+        self.size = size
+        self.entries = deque(maxlen=size)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        # Numbering and appending together, so entries stay in sequence order
+        with self._lock:
+            self.entries.append((next(self._seq), line))
+
+    def since(self, seq):
+        """Lines numbered `seq` or later (older ones may have been dropped) and the next seq."""
+        entries = list(self.entries)
+        if not entries or entries[-1][0] < seq:
+            return [], seq
+        return [line for number, line in entries if number >= seq], entries[-1][0] + 1
+
+
+def start_file_log(path=LOG_FILE, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+    """Sends `logger` records to a rotating file from a background thread.
+
+    Returns the running QueueListener (stop() flushes it), or None when logging to
+    a file is disabled (empty LOG_FILE) or the file cannot be opened.
+    """
+    if not path:
+        return None
+    try:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    except OSError as e:
+        print(f"No se pudo abrir el log {path}: {e}")
+        return None
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    records = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    return listener
@@ -1,192 +1,320 @@
+import time
+STARTED = time.perf_counter()
+
+import argparse
 import asyncio
+import importlib
+import json
+import sys
 import threading
-from config import KASA_IP, KASA_USERNAME, KASA_PASSWORD
+from config import KASA_IP, KASA_USERNAME, KASA_PASSWORD, DELAY, MONITORED_SERIES, PRIORITY
+from delay_buffer import DelayBuffer
 from kasa_manager import KasaManager
-from f1_monitor import F1Monitor
-from nascar_monitor import NascarMonitor
-from motogp_monitor import MotoGPMonitor
-from gui import F1FlagApp
+from metrics import registry as metrics
+
+# Monitors (and their network libraries) are only imported for the active series.
+MONITORS = {
+    "f1": ("f1_monitor", "F1Monitor"),
+    "f1_replay": ("f1_recorder", "F1ReplayMonitor"),
+    "nascar": ("nascar_monitor", "NascarMonitor"),
+    "motogp": ("motogp_monitor", "MotoGPMonitor"),
+}
+SERIES_NAMES = {"f1": "F1", "nascar": "NASCAR", "motogp": "MotoGP"}
+STARTUP_LABELS = {
+    "ui": "Interfaz lista",
+    "monitor": "Monitor iniciado",
+    "first_flag": "Primera bandera",
+    "first_light": "Primera luz",
+}
+startup_times = {}
+# Pause before restarting a monitor that failed
+RESTART_DELAY = 1
+IDLE_PROBE_SAMPLE = 600
+
+def mark_startup(name, logger=None):
+    """Records milliseconds since launch the first time a startup milestone is reached."""
+    if name in startup_times:
+        return False
+    startup_times[name] = round((time.perf_counter() - STARTED) * 1000)
+    if logger: logger(f"[Sistema] {STARTUP_LABELS[name]} en {startup_times[name]} ms")
+    return True
+
+def driving_series(selected, statuses, priority, connected):
+    """The series whose flag the bulb shows: the selected one, unless another
+    connected series is showing one of its priority codes (config.PRIORITY)."""
+    if statuses.get(selected) in priority.get(selected, ()):
+        return selected
+    for series, codes in priority.items():
+        if series in connected and statuses.get(series) in codes:
+            return series
+    return selected
+
+async def idle_probe(app, hours):
+    """Reports process CPU and thread count after `hours` of running, then exits.
 
-async def main_logic(app):
+    Threads are sampled every IDLE_PROBE_SAMPLE seconds to catch stray ones."""
+    started, cpu_started = time.monotonic(), time.process_time()
+    deadline = started + hours * 3600
+    peak = threading.active_count()
+    while (remaining := deadline - time.monotonic()) > 0:
+        await asyncio.sleep(min(IDLE_PROBE_SAMPLE, remaining))
+        peak = max(peak, threading.active_count())
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    print(json.dumps({
+        "hours": round(elapsed / 3600, 2),
+        "cpu_seconds": round(cpu, 2),
+        "cpu_percent": round(100 * cpu / elapsed, 4),
+        "threads": threading.active_count(),
+        "threads_peak": peak,
+        "thread_names": sorted(thread.name for thread in threading.enumerate()),
+    }), flush=True)
+    app.post_quit()
+
+async def load_monitor_class(kind):
+    """Imports a monitor module in a worker thread so the loop keeps running."""
+    module_name, class_name = MONITORS[kind]
+    module = await asyncio.to_thread(importlib.import_module, module_name)
+    return getattr(module, class_name)
+
+async def main_logic(app, options=None):
     monitor_thread_loop = asyncio.get_running_loop()
     app.monitor_thread_loop = monitor_thread_loop
     app.series_change_event = asyncio.Event()
     
     kasa_mgr = app.kasa_mgr
-    try:
-        msg = await kasa_mgr.connect()
-        app.add_log(msg)
-    except Exception as e:
-        app.add_log(str(e))
-
-    current_monitor = None
-    monitor_task = None
-    stop_monitor = asyncio.Event()
-    last_series = app.selected_series
-    
-    # State tracking for flags
-    last_f1_status = None
-    last_nascar_status = None
-    last_motogp_status = None
 
-    current_delay_task = None
+    async def connect_kasa():
+        try:
+            msg = await kasa_mgr.connect()
+            app.add_log(msg)
+        except Exception as e:
+            app.add_log(str(e))
+
+    # The bulb connects while the first monitor starts; a flag that arrives first
+    # simply waits for the connection inside set_color.
+    kasa_task = asyncio.create_task(connect_kasa())
+
+    monitors = {}        # series -> monitor; all of them stay warm across switches
+    tasks = {}           # series -> task running that monitor
+    statuses = {}        # series -> last flag code shown (after the broadcast delay)
+    selected = None      # series chosen in the UI
+    driving = None       # series whose flag the bulb shows
+
+    received = {}        # series -> last flag code received, before the broadcast delay
+    recorder = None
+    if options and options.record:
+        from f1_recorder import SessionRecorder
+        recorder = SessionRecorder(options.record)
     
-    async def delayed_set_color(status_str, logger=None):
-        import config
-        delay = config.settings.get("DELAY", 0)
-        if delay > 0:
-            if logger: logger(f"[Sistema] Esperando {delay}s antes de aplicar luz...")
-            try:
-                await asyncio.sleep(delay)
-            except asyncio.CancelledError:
-                if logger: logger(f"[Sistema] Cambio de luz cancelado.")
-                raise
-        await kasa_mgr.set_color(status_str, logger)
-
-    def schedule_color_change(status_str):
-        nonlocal current_delay_task
-        if current_delay_task and not current_delay_task.done():
-            current_delay_task.cancel()
-        current_delay_task = asyncio.create_task(delayed_set_color(status_str, app.add_log))
+    probe_reported = False
+
+    async def set_bulb(series, status_str, logger=None, received_at=None):
+        nonlocal probe_reported
+        ok = await kasa_mgr.set_color(status_str, logger, series=series)
+        if ok:
+            metrics.observe_since(series, "total", received_at)
+            mark_startup("first_light", logger)
+        if options and options.startup_probe and "first_flag" in startup_times and not probe_reported:
+            probe_reported = True
+            print(json.dumps(startup_times), flush=True)
+            app.post_quit()
+
+    def schedule_color_change(series, status_str, received_at=None):
+        # No cancelling: KasaManager already coalesces targets that overtake each other
+        asyncio.create_task(set_bulb(series, status_str, app.add_log, received_at))
+
+    def flag_detected(series):
+        """Records the ingest stage and returns when the triggering frame arrived."""
+        monitor = monitors.get(series)
+        received_at = monitor.last_frame_at if monitor else None
+        metrics.observe_since(series, "ingest", received_at)
+        mark_startup("first_flag", app.add_log)
+        return received_at
+
+    def arbitrate():
+        connected = {series for series, monitor in monitors.items() if monitor.connected}
+        return driving_series(selected, statuses, PRIORITY, connected)
+
+    def apply_driving(received_at=None):
+        """Points the bulb at the series chosen by arbitrate() and shows its flag."""
+        nonlocal driving
+        series = arbitrate()
+        code = statuses.get(series)
+        if series != selected and series != driving:
+            label = kasa_mgr.colors_for(series).get(code, (0, 0, 0, code))[3]
+            app.add_log(f"[Sistema] {label} en {series.upper()}: tiene prioridad sobre {selected.upper()}")
+        driving = series
+        if code:
+            schedule_color_change(series, code, received_at)
+
+    def show_status():
+        monitor = monitors.get(selected)
+        app.post_status(selected, statuses.get(selected), monitor.connected if monitor else False)
+
+    def flag_changed(series, status_str, received_at=None):
+        """A transition coming out of the delay buffer: the UI and the bulb follow it."""
+        statuses[series] = status_str
+        if series == selected:
+            show_status()
+        if series == driving or arbitrate() != driving:
+            apply_driving(received_at)
+
+    buffer = DelayBuffer(flag_changed, DELAY)
+    app.delay_buffer = buffer
+
+    def flag_received(series, status_str):
+        # Only update if status has changed
+        if received.get(series) == status_str:
+            return
+        received[series] = status_str
+        buffer.push(series, status_str, flag_detected(series))
 
     async def on_f1_update(update):
-        nonlocal last_f1_status
         if 'TrackStatus' in update:
-            status = update['TrackStatus'].get('Status')
+            status = monitors["f1"].state.get('TrackStatus.Status')
             if status:
-                status_str = str(status)
-                # Only update if status has changed
-                if status_str != last_f1_status:
-                    last_f1_status = status_str
-                    app.current_status_code = status_str
-                    app.after(0, lambda: app.update_status_ui(current_monitor.connected if current_monitor else False))
-                    # Schedule bulb color change with possible delay
-                    schedule_color_change(status_str)
+                flag_received("f1", str(status))
 
     async def on_nascar_update(update):
-        nonlocal last_nascar_status
         if 'NascarFlag' in update:
-            flag_data = update['NascarFlag']
-            flag_state = flag_data.get('flag_state')
+            flag_state = update['NascarFlag'].get('flag_state')
             if flag_state is not None:
-                flag_state_str = str(flag_state)
-                # Only update if status has changed
-                if flag_state_str != last_nascar_status:
-                    last_nascar_status = flag_state_str
-                    app.current_status_code = flag_state_str
-                    app.after(0, lambda: app.update_status_ui(current_monitor.connected if current_monitor else False))
-                    # Schedule bulb color change with possible delay
-                    schedule_color_change(flag_state_str)
+                flag_received("nascar", str(flag_state))
 
     async def on_motogp_update(update):
-        nonlocal last_motogp_status
         if 'MotoGPStatus' in update:
             status = update['MotoGPStatus'].get('Status')
             if status:
-                status_str = str(status)
-                # Only update if status has changed
-                if status_str != last_motogp_status:
-                    last_motogp_status = status_str
-                    app.current_status_code = status_str
-                    app.after(0, lambda: app.update_status_ui(current_monitor.connected if current_monitor else False))
-                    # Schedule bulb color change with possible delay
-                    schedule_color_change(status_str)
+                flag_received("motogp", str(status))
+        if 'MotoGPLeader' in update:
+            leader = update['MotoGPLeader']
+            app.add_log(f"[MotoGP] Nuevo líder: #{leader['number']} {leader['name']} (vuelta {leader['lap']})")
+        for battle in update.get('MotoGPBattle', []):
+            app.add_log(f"[MotoGP] Lucha por P{battle['pos']}: {battle['behind']} a {battle['gap']:.3f}s de {battle['ahead']}")
+
+    handlers = {"f1": on_f1_update, "nascar": on_nascar_update, "motogp": on_motogp_update}
+
+    def on_connection_change(series, connected):
+        if series == selected:
+            app.post_status(series, connected=connected)
+        # Priority flags only count while their monitor is connected
+        if arbitrate() != driving:
+            apply_driving()
+
+    async def start_monitor(series):
+        if series == "f1" and options and options.replay:
+            F1ReplayMonitor = await load_monitor_class("f1_replay")
+            monitor = F1ReplayMonitor(on_f1_update, app.add_log, options.replay, options.speed)
+        else:
+            monitor = (await load_monitor_class(series))(handlers[series], app.add_log)
+        if series == "f1":
+            monitor.recorder = recorder
+        monitor.on_connection_change = lambda connected: on_connection_change(series, connected)
+        monitors[series] = monitor
+        tasks[series] = asyncio.create_task(monitor.run())
+        app.add_log(f"[Sistema] Iniciando monitor {SERIES_NAMES[series]}...")
+        mark_startup("monitor", app.add_log)
+
+    async def select(series):
+        """Switches the UI and the bulb to a series; its monitor is already warm."""
+        nonlocal selected
+        selected = series
+        if series not in monitors:
+            await start_monitor(series)
+        kasa_mgr.set_series(series)
+        app.active_monitor = monitors[series]
+        show_status()
+        if arbitrate() != driving:
+            # The flag is already known (and already delayed), so it applies at once
+            apply_driving()
 
     async def run_monitor():
-        nonlocal current_monitor, monitor_task, last_series
-        while not stop_monitor.is_set():
-            # Get current series from app
-            series = app.selected_series
-            
-            # If series changed, stop current monitor
-            if series != last_series:
-                if monitor_task and not monitor_task.done():
-                    monitor_task.cancel()
-                    try:
-                        await monitor_task
-                    except (asyncio.CancelledError, Exception):
-                        pass
-                monitor_task = None
-                current_monitor = None
-                last_series = series
-            
-            # Create and start appropriate monitor if not running
-            if not monitor_task or monitor_task.done():
-                # Update KasaManager series before starting monitor
-                kasa_mgr.set_series(series)
-                
-                if series == "f1":
-                    current_monitor = F1Monitor(on_f1_update, app.add_log)
-                    app.add_log("[Sistema] Iniciando monitor F1...")
-                    # Update bulb immediately to last known F1 status if available
-                    if last_f1_status:
-                        schedule_color_change(last_f1_status)
-                elif series == "nascar":
-                    current_monitor = NascarMonitor(on_nascar_update, app.add_log, poll_interval=5)
-                    app.add_log("[Sistema] Iniciando monitor NASCAR...")
-                    # Update bulb immediately to last known NASCAR status if available
-                    if last_nascar_status:
-                        schedule_color_change(last_nascar_status)
-                elif series == "motogp":
-                    current_monitor = MotoGPMonitor(on_motogp_update, app.add_log)
-                    app.add_log("[Sistema] Iniciando monitor MotoGP...")
-                    # Update bulb immediately to last known MotoGP status if available
-                    if last_motogp_status:
-                        schedule_color_change(last_motogp_status)
-                
-                monitor_task = asyncio.create_task(current_monitor.run())
-            
-            # Wait for series change or monitor completion
+        await select(app.selected_series)
+        for series in MONITORED_SERIES:
+            if series not in MONITORS:
+                app.add_log(f"[Sistema] Serie desconocida en MONITORED_SERIES: {series}")
+            elif series not in monitors:
+                await start_monitor(series)
+
+        while True:
+            # Sleep until a monitor ends or the series changes; nothing wakes up otherwise
+            series_changed = asyncio.create_task(app.series_change_event.wait())
             try:
-                # Check for series change periodically
-                while not stop_monitor.is_set():
-                    try:
-                        await asyncio.wait_for(app.series_change_event.wait(), timeout=0.5)
-                        if app.selected_series != series:
-                            app.series_change_event.clear()
-                            break
-                    except asyncio.TimeoutError:
-                        # Check if monitor task is still running
-                        if monitor_task and monitor_task.done():
-                            # Monitor stopped, restart it
-                            break
-                        # Continue waiting
-                        continue
-            except Exception as e:
-                app.add_log(f"[Sistema Error] {e}")
-                await asyncio.sleep(1)
-
-    # Update UI periodically for connection status
-    def update_conn_ui():
-        if current_monitor:
-            app.after(0, lambda: app.update_status_ui(current_monitor.connected))
-        timer = threading.Timer(5, update_conn_ui)
-        timer.daemon = True
-        timer.start()
-    
-    update_conn_ui()
-    
+                done, _ = await asyncio.wait({*tasks.values(), series_changed}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                series_changed.cancel()
+            if series_changed in done:
+                app.series_change_event.clear()
+                if app.selected_series != selected:
+                    await select(app.selected_series)
+
+            failed = [series for series, task in tasks.items() if task in done]
+            for series in failed:
+                task = tasks[series]
+                if not task.cancelled() and task.exception():
+                    app.add_log(f"[Sistema Error] {SERIES_NAMES[series]}: {task.exception()}")
+            if failed:
+                await asyncio.sleep(RESTART_DELAY)
+                for series in failed:
+                    await start_monitor(series)
+
+    if options and options.idle_probe:
+        asyncio.create_task(idle_probe(app, options.idle_probe))
+
     try:
         await run_monitor()
     except asyncio.CancelledError:
         pass
     finally:
-        stop_monitor.set()
-        if monitor_task:
-            monitor_task.cancel()
+        kasa_task.cancel()
+        buffer.close()
+        for task in tasks.values():
+            task.cancel()
+        if recorder:
+            recorder.close()
+        # The shared HTTP pool only exists if a monitor imported it
+        if "http_client" in sys.modules:
+            await sys.modules["http_client"].http.close()
 
-def start_background_loop(app):
+def start_background_loop(app, options=None):
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    loop.run_until_complete(main_logic(app))
+    loop.run_until_complete(main_logic(app, options))
+
+def build_parser(description="Racing Flag Monitor"):
+    """Options shared by the desktop app and the headless daemon."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--record", metavar="ARCHIVO", help="graba los frames de F1 recibidos en ARCHIVO")
+    parser.add_argument("--replay", metavar="ARCHIVO", help="reproduce una grabación de F1 en lugar de conectar en vivo")
+    parser.add_argument("--speed", type=float, default=1.0, help="velocidad de reproducción (0 = lo más rápido posible)")
+    parser.add_argument("--startup-probe", action="store_true",
+                        help="imprime los tiempos de arranque (JSON) y sale tras la primera bandera")
+    parser.add_argument("--idle-probe", metavar="HORAS", type=float, nargs="?", const=24,
+                        help="mide CPU e hilos en reposo durante HORAS (24 por defecto), lo imprime (JSON) y sale")
+    return parser
+
+def parse_args():
+    return build_parser().parse_args()
 
 if __name__ == "__main__":
+    # Tk is only imported for the desktop app; daemon.py reuses main_logic without it
+    from gui import F1FlagApp
+    from log_pipeline import start_file_log
+    options = parse_args()
+    log_listener = start_file_log()
     kasa_mgr = KasaManager(KASA_IP, KASA_USERNAME, KASA_PASSWORD)
     # The app will be initialized first, then the loop
     app = F1FlagApp(kasa_mgr, None)
     
-    # Start F1 Monitor in background
-    bg_thread = threading.Thread(target=start_background_loop, args=(app,), daemon=True)
-    bg_thread.start()
-    
+    # Start the monitors once the window is up, so the network stack never delays the UI
+    bg_thread = threading.Thread(target=start_background_loop, args=(app, options), daemon=True)
+
+    def on_ui_ready():
+        mark_startup("ui", app.add_log)
+        bg_thread.start()
+
+    app.after_idle(on_ui_ready)
     app.mainloop()
+    if log_listener:
+        log_listener.stop()
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import deque
+
+WINDOW = 500
+QUANTILES = (0.5, 0.95, 0.99)
+
+class RollingHistogram:
+    """Keeps the last WINDOW samples of a latency and answers percentile queries."""
+    def __init__(self, size=WINDOW):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def percentiles(self, quantiles=QUANTILES):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: None for q in quantiles}
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(round(q * last)))] for q in quantiles}
+
+class MetricsRegistry:
+    """Latency histograms per (series, stage[, device]), shared by the monitor loop and the UIs.
+
+    Stages used by the app:
+      feed_lag   upstream timestamp -> frame received (where the feed has one)
+      ingest     frame received -> flag change detected
+      delay      time spent in the configured broadcast DELAY
+      delay_error  delayed replay firing late versus arrival + DELAY
+      kasa       set_hsv round trip, per device
+      kasa_connect  direct bulb connection from the discovery cache, per device
+      kasa_discover  full discovery + connection, per device
+      kasa_skew  first to last bulb confirming the same change
+      reconnect  time without a live feed during a reconnect
+      http       request sent -> response headers, per host
+      http_connect  new pooled connection (DNS + TCP + TLS), per host
+      http_dns   DNS lookups that missed the cache, per host
+      detect     expected detection delay of a polled feed (half the interval + request)
+      total      frame received -> bulb confirmed
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, series, stage, seconds, device=None):
+        with self._lock:
+            key = (series, stage, device or "")
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = RollingHistogram()
+            hist.observe(seconds)
+
+    def observe_since(self, series, stage, started, device=None):
+        """Records time.monotonic() - started; ignores a missing start."""
+        if started is not None:
+            self.observe(series, stage, time.monotonic() - started, device)
+
+    def percentiles(self, series, stage, device=None):
+        with self._lock:
+            hist = self._histograms.get((series, stage, device or ""))
+            return hist.percentiles() if hist else {q: None for q in QUANTILES}
+
+    def render_prometheus(self):
+        """Text exposition format, one summary metric labelled by series and stage."""
+        lines = [
+            "# HELP flag_latency_seconds Latency of each stage of the flag pipeline (rolling window).",
+            "# TYPE flag_latency_seconds summary",
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+            snapshot = [(key, hist.percentiles(), hist.sum, hist.count) for key, hist in items]
+        for (series, stage, device), quantiles, total, count in snapshot:
+            labels = f'series="{series}",stage="{stage}"'
+            if device:
+                labels += f',device="{device}"'
+            for q, value in quantiles.items():
+                if value is not None:
+                    lines.append(f'flag_latency_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+            lines.append(f"flag_latency_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"flag_latency_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, series, stage="total"):
+        """Compact "p50/p95/p99" readout in milliseconds for the GUI."""
+        values = self.percentiles(series, stage)
+        if values[0.5] is None:
+            return "—"
+        return "/".join(f"{values[q] * 1000:.0f}" for q in QUANTILES) + " ms"
+
+registry = MetricsRegistry()
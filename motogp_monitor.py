@@ -1,16 +1,26 @@
 import asyncio
-import requests
 import json
 import time
+from http_client import http
+from connection_state import ConnectionState
+from motogp_table import RiderTable
+from poll_scheduler import AdaptivePoller, RACING, CAUTION, IDLE, ERROR
 
-class MotoGPMonitor:
+# Polling state for each session status; anything else (finished, no session) is idle.
+POLL_STATES = {"G": RACING, "Y": CAUTION, "R": CAUTION, "C": CAUTION}
+STATS_LOG_INTERVAL = 600
+
+class MotoGPMonitor(ConnectionState):
     """Handles the connection to MotoGP Live Timing and data processing."""
-    def __init__(self, on_update_callback, logger):
+    def __init__(self, on_update_callback, logger, poller=None):
         self.on_update = on_update_callback
         self.log = logger
         self.connected = False
+        self.poller = poller or AdaptivePoller("motogp")
         self.loop = None
         self.last_status = None
+        self.table = None          # RiderTable of the last poll with timing rows
+        self.last_battles = ()
 
     async def fetch_data(self):
         url = "https://api.motogp.pulselive.com/motogp/v1/timing-gateway/livetiming-lite"
@@ -20,43 +30,91 @@ class MotoGPMonitor:
             "Origin": "https://www.motogp.com",
             "Referer": "https://www.motogp.com/"
         }
-        try:
-            return await asyncio.to_thread(requests.get, url, headers=headers, timeout=10)
-        except Exception as e:
-            raise e
+        async with http.get(url, "motogp", headers=headers) as resp:
+            return resp.status, await resp.read()
+
+    async def update_riders(self, rows):
+        """Loads the timing rows and reports only riders whose row changed, plus
+        leader changes and close battles near the front."""
+        previous = self.table
+        table = previous.successor() if previous else RiderTable()
+        table.load(rows)
+        self.table = table
+        changed = table.changed_slots(previous)
+        if not changed:
+            return
+
+        order = table.order()
+        ahead = table.gaps_ahead(order)
+        gained = table.position_changes(previous) if previous else {}
+        pos = table.columns["pos"]
+        update = {"MotoGPRiders": [table.row(slot, ahead, gained) for slot in sorted(changed, key=pos.__getitem__)]}
+
+        leader = table.leader(order)
+        if previous is not None and leader is not None and leader != previous.leader():
+            update["MotoGPLeader"] = table.row(leader, ahead, gained)
+        battles = table.battles(order, ahead)
+        pairs = tuple((front, behind) for _, front, behind, _ in battles)
+        if pairs != self.last_battles:
+            self.last_battles = pairs
+            update["MotoGPBattle"] = [
+                {"pos": position, "ahead": table.riders[front][1], "behind": table.riders[behind][1], "gap": gap}
+                for position, front, behind, gap in battles
+            ]
+        await self.on_update(update)
 
     async def run(self):
         self.loop = asyncio.get_running_loop()
+        next_stats_log = time.monotonic() + STATS_LOG_INTERVAL
+        interval = 0  # the first poll goes out immediately
         
         while True:
             try:
-                self.log("[MotoGP] Consultando API...")
-                resp = await self.fetch_data()
+                self.poller.request_started()
+                status, body = await self.fetch_data()
+                self.poller.request_finished(interval)
                 
-                if resp.status_code == 200:
+                if status == 200:
                     self.connected = True
+                    self.last_frame_at = time.monotonic()
                     try:
-                        data = resp.json()
+                        data = json.loads(body)
                         head = data.get("head", {})
                         status_id = head.get("session_status_id")
+                        # Laps remaining, when the feed provides them
+                        changed = self.poller.update(POLL_STATES.get(status_id, IDLE), head.get("remaining"))
                         
                         if status_id and status_id != self.last_status:
                             self.last_status = status_id
                             # Usamos un formato compatible con el callback general
                             await self.on_update({"MotoGPStatus": {"Status": status_id}})
+                        rows = data.get("rider")
+                        if rows:
+                            await self.update_riders(rows)
                     except json.JSONDecodeError:
                         self.log("[MotoGP] Respuesta no es JSON válido.")
-                elif resp.status_code in [403, 404]:
+                        changed = self.poller.update(ERROR)
+                elif status in [403, 404]:
                     self.connected = False
-                    self.log("[MotoGP] No hay sesión activa en este momento.")
+                    if self.poller.update(IDLE):
+                        self.log("[MotoGP] No hay sesión activa en este momento.")
+                    changed = False
                 else:
                     self.connected = False
-                    self.log(f"[MotoGP] Error HTTP {resp.status_code}")
+                    self.log(f"[MotoGP] Error HTTP {status}")
+                    changed = self.poller.update(ERROR)
+
+                if changed:
+                    self.log(f"[MotoGP] Sondeo: {self.poller.summary()}")
+                if time.monotonic() >= next_stats_log:
+                    next_stats_log += STATS_LOG_INTERVAL
+                    self.log(f"[MotoGP] Sondeo: {self.poller.summary()}")
+                    self.log(f"[HTTP] {http.summary()}")
                 
-                # MotoGP actualiza seguido durante la carrera. 5-10s
-                await asyncio.sleep(10)
+                interval = await self.poller.wait()
                 
             except Exception as e:
                 self.connected = False
-                self.log(f"[MotoGP Error] {e}. Reintentando en 15s...")
-                await asyncio.sleep(15)
+                self.poller.update(ERROR)
+                self.log(f"[MotoGP Error] {e}. Reintentando en {self.poller.next_interval():.0f}s...")
+                interval = await self.poller.wait()
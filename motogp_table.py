@@ -0,0 +1,159 @@
+"""
+Columnar rider table for MotoGP livetiming-lite.
+
+Every rider gets a fixed slot the first time they are seen, and each poll is decoded
+straight into typed `array` columns (position, lap, gap to the leader, last lap
+time, pit and status codes) instead of keeping the per-rider dicts. Diffing two
+polls compares whole columns first (a C-level bytes comparison), so an unchanged
+column costs nothing; gaps to the rider ahead come from one sort by position.
+Unknown numbers are stored as MISSING so columns compare exactly.
+"""
+from array import array
+
+MISSING = -1.0
+BATTLE_GAP = 0.5          # seconds to the rider ahead that counts as a battle
+BATTLE_POSITIONS = 5      # only battles for these positions are reported
+CAPACITY = 32
+
+COLUMNS = {
+    "pos": "h",
+    "lap": "h",
+    "gap_first": "d",
+    "last_lap_time": "d",
+    "on_pit": "b",
+    "status": "h",
+}
+
+
+def parse_seconds(value):
+    """'1:39.123', '+0.456', '0.456' -> seconds; laps behind, blanks and junk -> MISSING."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value or not isinstance(value, str):
+        return MISSING
+    text = value.strip().lstrip("+")
+    try:
+        if ":" in text:
+            minutes, seconds = text.split(":", 1)
+            return int(minutes) * 60 + float(seconds)
+        return float(text)
+    except ValueError:
+        return MISSING
+
+
+def _int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class RiderTable:
+    """Typed columns for one poll; `slots` maps a rider number to its row."""
+    def __init__(self, slots=None, riders=None, status_codes=None, capacity=CAPACITY):
+        # Slot assignment and rider names are shared between consecutive tables
+        self.slots = slots if slots is not None else {}
+        self.riders = riders if riders is not None else []
+        self.status_codes = status_codes if status_codes is not None else {}
+        self.capacity = max(capacity, len(self.riders))
+        self.count = 0        # riders with a slot when this table was loaded
+        self.columns = {name: array(code, [0]) * self.capacity for name, code in COLUMNS.items()}
+        self.columns["gap_first"] = array("d", [MISSING]) * self.capacity
+        self.columns["last_lap_time"] = array("d", [MISSING]) * self.capacity
+
+    def successor(self):
+        """An empty table for the next poll with the same rider slots."""
+        return RiderTable(self.slots, self.riders, self.status_codes, self.capacity)
+
+    def _slot(self, number, row):
+        slot = self.slots.get(number)
+        if slot is None:
+            slot = self.slots[number] = len(self.riders)
+            name = f"{row.get('rider_name', '')} {row.get('rider_surname', '')}".strip()
+            self.riders.append((number, name or number))
+            if slot >= self.capacity:
+                for column_name, column in self.columns.items():
+                    filler = MISSING if COLUMNS[column_name] == "d" else 0
+                    column.extend([filler] * self.capacity)
+                self.capacity *= 2
+        return slot
+
+    def load(self, rows):
+        """Decodes the livetiming-lite `rider` rows (a dict or a list) into the columns."""
+        pos, lap = self.columns["pos"], self.columns["lap"]
+        gap, last = self.columns["gap_first"], self.columns["last_lap_time"]
+        pit, status = self.columns["on_pit"], self.columns["status"]
+        codes = self.status_codes
+        for row in rows.values() if isinstance(rows, dict) else rows:
+            number = str(row.get("rider_number") or row.get("rider_id") or "")
+            if not number:
+                continue
+            slot = self._slot(number, row)
+            pos[slot] = _int(row.get("pos", row.get("order")))
+            lap[slot] = _int(row.get("num_lap", row.get("last_lap")))
+            gap[slot] = 0.0 if pos[slot] == 1 else parse_seconds(row.get("gap_first"))
+            last[slot] = parse_seconds(row.get("last_lap_time", row.get("lap_time")))
+            pit[slot] = 1 if row.get("on_pit") else 0
+            status[slot] = codes.setdefault(row.get("status_name"), len(codes))
+        self.count = len(self.riders)
+        return self
+
+    def changed_slots(self, previous):
+        """Slots whose row differs from `previous`, checking whole columns first."""
+        if previous is None:
+            return set(range(self.count))
+        # Riders first seen in this poll
+        changed = set(range(previous.count, self.count))
+        for name, column in self.columns.items():
+            old = previous.columns[name]
+            if old.tobytes() == column.tobytes():
+                continue
+            changed.update(i for i, (a, b) in enumerate(zip(old, column)) if a != b)
+        return {slot for slot in changed if slot < self.count}
+
+    def order(self):
+        """Slots of classified riders sorted by position."""
+        pos = self.columns["pos"]
+        return sorted((slot for slot in range(self.count) if pos[slot] > 0), key=pos.__getitem__)
+
+    def gaps_ahead(self, order=None):
+        """{slot: seconds to the rider one position ahead} where both gaps are known."""
+        order = self.order() if order is None else order
+        gap = self.columns["gap_first"]
+        return {b: gap[b] - gap[a] for a, b in zip(order, order[1:])
+                if gap[a] != MISSING and gap[b] != MISSING}
+
+    def leader(self, order=None):
+        order = self.order() if order is None else order
+        return order[0] if order else None
+
+    def position_changes(self, previous):
+        """{slot: places gained (negative when lost)} against the previous poll."""
+        old, new = previous.columns["pos"], self.columns["pos"]
+        if old.tobytes() == new.tobytes():
+            return {}
+        return {i: a - b for i, (a, b) in enumerate(zip(old, new)) if a != b and a > 0 and b > 0}
+
+    def battles(self, order=None, ahead=None, gap=BATTLE_GAP, positions=BATTLE_POSITIONS):
+        """[(position, slot ahead, slot behind, gap)] for close fights near the front."""
+        order = self.order() if order is None else order
+        ahead = self.gaps_ahead(order) if ahead is None else ahead
+        pos = self.columns["pos"]
+        return [(pos[b], a, b, ahead[b]) for a, b in zip(order, order[1:])
+                if pos[b] <= positions and b in ahead and 0 <= ahead[b] < gap]
+
+    def row(self, slot, gaps_ahead=None, changes=None):
+        """One rider as a dict, for callbacks and logs only."""
+        number, name = self.riders[slot]
+        columns = self.columns
+        gap = columns["gap_first"][slot]
+        return {
+            "number": number,
+            "name": name,
+            "pos": columns["pos"][slot],
+            "lap": columns["lap"][slot],
+            "gap_first": None if gap == MISSING else gap,
+            "gap_ahead": (gaps_ahead or {}).get(slot),
+            "gained": (changes or {}).get(slot, 0),
+            "on_pit": bool(columns["on_pit"][slot]),
+        }
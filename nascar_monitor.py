@@ -1,7 +1,21 @@
-import json
-import requests
+import time
 import asyncio
+import aiohttp
 from config import F1_UA
+from http_client import http
+from connection_state import ConnectionState
+from json_scan import TopLevelScanner, scan_fields
+from poll_scheduler import AdaptivePoller, RACING, FINAL_LAPS, CAUTION, IDLE, ERROR
+
+# fetch_flag result when the feed has not changed since the previous poll.
+UNCHANGED = object()
+# How often the polling savings are written to the log.
+STATS_LOG_INTERVAL = 600
+# Top-level scalars of live-feed.json the flag path uses; the per-vehicle data is never parsed.
+FLAG_FIELDS = ('flag_state', 'lap_number', 'elapsed_time', 'race_id', 'laps_in_race', 'laps_to_go')
+CHUNK_SIZE = 16384
+# Polling state for each flag_state; anything else (none, checkered, cold track) is idle.
+POLL_STATES = {1: RACING, 2: CAUTION, 3: CAUTION, 4: FINAL_LAPS, 8: CAUTION}
 
 def get_flag_name(code):
     """Maps NASCAR flag_state code to flag name."""
@@ -24,11 +38,12 @@ def fetch_nascar_flag():
     Simple function to fetch the current NASCAR flag state.
     Returns a dictionary with flag information or None if error.
     """
+    import requests  # synchronous helper for scripts; the monitor uses http_client
     endpoint = "https://cf.nascar.com/live/feeds/live-feed.json"
     try:
-        resp = requests.get(endpoint, headers={'User-Agent': F1_UA}, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
+        with requests.get(endpoint, headers={'User-Agent': F1_UA}, timeout=10, stream=True) as resp:
+            resp.raise_for_status()
+            data, _ = scan_fields(resp.iter_content(CHUNK_SIZE), FLAG_FIELDS)
         flag_state = data.get('flag_state')
         
         if flag_state is not None:
@@ -47,21 +62,136 @@ def fetch_nascar_flag():
     
     return None
 
-class NascarMonitor:
-    """Handles the connection to NASCAR Live Feed and data processing."""
-    def __init__(self, on_update_callback, logger, poll_interval=5):
+class PollStats:
+    """What conditional polling saved: payloads not downloaded (304) and scans skipped."""
+    def __init__(self):
+        self.started = time.monotonic()
+        self.polls = 0
+        self.not_modified = 0      # 304 answers: no body, no parse
+        self.same_fields = 0       # body downloaded but the flag fields did not change
+        self.bytes_received = 0
+        self.bytes_saved = 0
+        self.parse_cpu = 0.0
+        self.parses = 0
+        self.last_size = 0
+
+    def record_parse(self, size, cpu):
+        self.polls += 1
+        self.parses += 1
+        self.parse_cpu += cpu
+        self.bytes_received += size
+        self.last_size = size
+
+    def record_not_modified(self):
+        self.polls += 1
+        self.not_modified += 1
+        self.bytes_saved += self.last_size
+
+    def record_same_fields(self, size, cpu):
+        self.polls += 1
+        self.same_fields += 1
+        self.parses += 1
+        self.parse_cpu += cpu
+        self.bytes_received += size
+
+    def cpu_saved(self):
+        """Scans avoided by 304 answers, at the average measured scan cost."""
+        if not self.parses:
+            return 0.0
+        return self.not_modified * self.parse_cpu / self.parses
+
+    def per_hour(self):
+        """(bytes saved, CPU seconds saved) per hour of polling."""
+        hours = max(time.monotonic() - self.started, 1) / 3600
+        return self.bytes_saved / hours, self.cpu_saved() / hours
+
+    def summary(self):
+        if not self.polls:
+            return "sin consultas"
+        bytes_per_hour, cpu_per_hour = self.per_hour()
+        skipped = self.not_modified + self.same_fields
+        return (f"{skipped}/{self.polls} consultas sin cambios ({self.not_modified} con 304); "
+                f"ahorro {bytes_per_hour / 1e6:.1f} MB/h y {cpu_per_hour:.2f} s de CPU/h")
+
+def poll_state(flag_data):
+    """Race state for the adaptive poller from the flag fields."""
+    if not flag_data.get('race_id'):
+        return IDLE
+    return POLL_STATES.get(flag_data.get('flag_state'), IDLE)
+
+class NascarMonitor(ConnectionState):
+    """Handles the connection to NASCAR Live Feed and data processing.
+
+    Polls adaptively (poll_scheduler.py); a poll_interval fixes the interval instead.
+    """
+    def __init__(self, on_update_callback, logger, poll_interval=None, poller=None):
         self.on_update = on_update_callback
         self.log = logger
         self.connected = False
-        self.poll_interval = poll_interval
+        if poller is None:
+            fixed = {state: poll_interval for state in (RACING, FINAL_LAPS, CAUTION, IDLE, ERROR, "idle_max")}
+            poller = AdaptivePoller("nascar", fixed if poll_interval else None)
+        self.poller = poller
+        self.last_flag_state = None
+        # Race state and laps to go of the last payload; an unchanged feed keeps them
+        self.last_race_state = (IDLE, None)
         self.endpoint = "https://cf.nascar.com/live/feeds/live-feed.json"
+        # Validators and flag fields of the last payload, to skip unchanged ones
+        self.etag = None
+        self.last_modified = None
+        self.last_fields = None
+        self.stats = PollStats()
+
+    async def _get(self):
+        """Conditional GET over the shared HTTP pool with a streaming scan.
+
+        Only the top-level FLAG_FIELDS are decoded, and scanning stops once they are
+        all found. Returns them, or UNCHANGED when the server answered 304 or the
+        fields are the same as in the last payload (the CDN does not always honour
+        the validators).
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        async with http.get(self.endpoint, "nascar", headers=headers) as resp:
+            if resp.status == 304:
+                self.stats.record_not_modified()
+                return UNCHANGED
+            resp.raise_for_status()
+            self.etag = resp.headers.get('ETag')
+            self.last_modified = resp.headers.get('Last-Modified')
+
+            scanner = TopLevelScanner(FLAG_FIELDS)
+            size = 0
+            cpu = 0.0
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                size += len(chunk)
+                # Past the flag fields the rest is only drained, so the
+                # connection goes back to the pool
+                if not scanner.done:
+                    started = time.thread_time()
+                    scanner.feed(chunk)
+                    cpu += time.thread_time() - started
+
+        fields = scanner.found
+        if fields == self.last_fields:
+            self.stats.record_same_fields(size, cpu)
+            return UNCHANGED
+        self.stats.record_parse(size, cpu)
+        self.last_fields = fields
+        return fields
 
     async def fetch_flag(self):
-        """Fetches the current flag state from NASCAR endpoint."""
+        """Fetches the current flag state from NASCAR endpoint.
+
+        Returns the flag data, UNCHANGED if the feed did not change, or None on error.
+        """
         try:
-            resp = requests.get(self.endpoint, headers={'User-Agent': F1_UA}, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
+            data = await self._get()
+            if data is UNCHANGED:
+                return UNCHANGED
             flag_state = data.get('flag_state')
             
             if flag_state is not None:
@@ -71,11 +201,12 @@ class NascarMonitor:
                     'flag_name': flag_name,
                     'lap_number': data.get('lap_number'),
                     'elapsed_time': data.get('elapsed_time'),
-                    'race_id': data.get('race_id')
+                    'race_id': data.get('race_id'),
+                    'laps_to_go': data.get('laps_to_go')
                 }
-        except requests.exceptions.RequestException as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             self.log(f"[NASCAR] Error fetching data: {e}")
-        except json.JSONDecodeError as e:
+        except ValueError as e:  # json.JSONDecodeError included
             self.log(f"[NASCAR] Error parsing JSON: {e}")
         except Exception as e:
             self.log(f"[NASCAR] Unexpected error: {e}")
@@ -84,24 +215,44 @@ class NascarMonitor:
 
     async def run(self):
         """Main monitoring loop that polls the NASCAR endpoint."""
+        next_stats_log = time.monotonic() + STATS_LOG_INTERVAL
+        interval = 0  # the first poll goes out immediately
         while True:
             try:
-                self.connected = False
-                self.log("[NASCAR] Obteniendo estado de bandera...")
-                
+                self.poller.request_started()
                 flag_data = await self.fetch_flag()
+                self.poller.request_finished(interval)
                 
-                if flag_data:
+                if flag_data is UNCHANGED:
+                    # Same payload as the last poll: a successful poll with nothing to parse
                     self.connected = True
-                    self.log(f"[NASCAR] Bandera: {flag_data['flag_name']} (código: {flag_data['flag_state']})")
+                    self.last_frame_at = time.monotonic()
+                    changed = self.poller.update(*self.last_race_state)
+                elif flag_data:
+                    self.connected = True
+                    self.last_frame_at = time.monotonic()
+                    if flag_data['flag_state'] != self.last_flag_state:
+                        self.last_flag_state = flag_data['flag_state']
+                        self.log(f"[NASCAR] Bandera: {flag_data['flag_name']} (código: {flag_data['flag_state']})")
+                    self.last_race_state = (poll_state(flag_data), flag_data.get('laps_to_go'))
+                    changed = self.poller.update(*self.last_race_state)
                     await self.on_update({'NascarFlag': flag_data})
                 else:
+                    self.connected = False
                     self.log("[NASCAR] No se pudo obtener el estado de bandera")
+                    changed = self.poller.update(ERROR)
+
+                if changed:
+                    self.log(f"[NASCAR] Sondeo: {self.poller.summary()}")
+                if time.monotonic() >= next_stats_log:
+                    next_stats_log += STATS_LOG_INTERVAL
+                    self.log(f"[NASCAR] Sondeo condicional: {self.stats.summary()}; {self.poller.summary()}")
+                    self.log(f"[HTTP] {http.summary()}")
                 
-                await asyncio.sleep(self.poll_interval)
+                interval = await self.poller.wait()
                 
             except Exception as e:
                 self.connected = False
-                self.log(f"[NASCAR Error] {e}. Reintentando en {self.poll_interval}s...")
-                await asyncio.sleep(self.poll_interval)
-
+                self.poller.update(ERROR)
+                self.log(f"[NASCAR Error] {e}. Reintentando en {self.poller.next_interval():.0f}s...")
+                interval = await self.poller.wait()
@@ -0,0 +1,107 @@
+"""
+Adaptive polling intervals for the HTTP-polled series (NASCAR and MotoGP).
+
+The monitors tell the poller what the race is doing after every poll and it picks
+the next interval: tight while a flag change is likely (green-flag racing, final
+laps), relaxed under caution, and an exponential backoff with jitter while nothing
+is running. A minimum spacing between requests caps the request rate whatever the
+configured intervals are. Clock, sleep and random source are injectable for testing.
+"""
+import asyncio
+import random
+import time
+from config import POLL_INTERVALS, MAX_POLL_RATE
+from metrics import registry as metrics
+
+RACING = "racing"
+FINAL_LAPS = "final_laps"
+CAUTION = "caution"
+IDLE = "idle"
+ERROR = "error"
+
+STATE_LABELS = {
+    RACING: "carrera",
+    FINAL_LAPS: "vueltas finales",
+    CAUTION: "neutralización",
+    IDLE: "sin sesión",
+    ERROR: "error",
+}
+FINAL_LAPS_THRESHOLD = 10  # laps to go at which the final-laps interval kicks in
+JITTER = 0.1
+# States in which a flag change matters; the reported detection latency covers these.
+ON_TRACK = (RACING, FINAL_LAPS, CAUTION)
+
+
+class AdaptivePoller:
+    """Chooses the wait before each poll from the last known race state.
+
+    Besides the intervals it keeps the expected detection latency of every poll:
+    a change happens on average half an interval before the next request, plus the
+    request itself. detection_latency() is that average weighted by time, per state.
+    """
+    def __init__(self, series, intervals=None, max_rate=None, clock=time.monotonic,
+                 sleep=asyncio.sleep, rng=random.random):
+        self.series = series
+        self.intervals = dict(POLL_INTERVALS, **(intervals or {}))
+        self.min_spacing = 1 / (max_rate or MAX_POLL_RATE)
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng
+        self.state = IDLE
+        self.idle_polls = 0
+        self.last_request_at = None
+        self._latency = {}   # state -> (sum of latency * interval, sum of intervals)
+
+    def update(self, state, laps_to_go=None):
+        """Records the race state seen on the last poll; returns True if it changed."""
+        if state == RACING and isinstance(laps_to_go, (int, float)) and 0 <= laps_to_go <= FINAL_LAPS_THRESHOLD:
+            state = FINAL_LAPS
+        self.idle_polls = self.idle_polls + 1 if state in (IDLE, ERROR) else 0
+        changed = state != self.state
+        self.state = state
+        return changed
+
+    def next_interval(self):
+        if self.state in (IDLE, ERROR):
+            base = self.intervals[self.state]
+            interval = min(self.intervals["idle_max"], base * 2 ** max(0, self.idle_polls - 1))
+            interval *= 1 + JITTER * (2 * self.rng() - 1)
+        else:
+            interval = self.intervals[self.state]
+        return max(self.min_spacing, interval)
+
+    def request_started(self):
+        self.last_request_at = self.clock()
+
+    def request_finished(self, interval):
+        """Accounts one poll: the interval waited before it and its duration."""
+        if self.last_request_at is None:
+            return
+        duration = self.clock() - self.last_request_at
+        expected = interval / 2 + duration
+        metrics.observe(self.series, "detect", expected)
+        weighted, total = self._latency.get(self.state, (0.0, 0.0))
+        self._latency[self.state] = (weighted + expected * interval, total + interval)
+
+    def detection_latency(self, states=ON_TRACK):
+        """Time-weighted average of the expected flag detection latency, or None."""
+        weighted = sum(self._latency.get(state, (0.0, 0.0))[0] for state in states)
+        total = sum(self._latency.get(state, (0.0, 0.0))[1] for state in states)
+        return weighted / total if total else None
+
+    async def wait(self):
+        """Sleeps until the next poll is due; returns the interval used."""
+        interval = self.next_interval()
+        delay = interval
+        if self.last_request_at is not None:
+            # Spacing is measured between request starts, so slow requests do not
+            # push the rate over the ceiling and fast ones are not delayed twice.
+            delay = max(0.0, self.last_request_at + interval - self.clock())
+        await self.sleep(delay)
+        return interval
+
+    def summary(self):
+        latency = self.detection_latency()
+        latency_text = f"{latency:.1f}s" if latency is not None else "—"
+        return (f"estado {STATE_LABELS[self.state]}, cada {self.next_interval():.0f}s, "
+                f"detección media en pista {latency_text}")
@@ -1,10 +1,11 @@
 import asyncio
 import threading
 import time
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request
 from config import KASA_IP, KASA_USERNAME, KASA_PASSWORD, COLORS
 from kasa_manager import KasaManager
 from f1_monitor import F1Monitor
+from metrics import registry as metrics
 
 app = Flask(__name__)
 
@@ -24,7 +25,7 @@ def add_log(msg):
 async def on_f1_update(update):
     global current_status, f1_connected
     if 'TrackStatus' in update:
-        status_code = update['TrackStatus'].get('Status')
+        status_code = monitor.state.get('TrackStatus.Status')
         if status_code:
             color_info = COLORS.get(status_code)
             if color_info:
@@ -33,7 +34,10 @@ async def on_f1_update(update):
                     "label": color_info[3],
                     "color": color_info[4]
                 }
-            await kasa_mgr.set_color(status_code, add_log)
+            received_at = monitor.last_frame_at
+            metrics.observe_since("f1", "ingest", received_at)
+            if await kasa_mgr.set_color(status_code, add_log):
+                metrics.observe_since("f1", "total", received_at)
 
 def start_monitor_loop():
     global monitor
@@ -65,10 +69,22 @@ def get_status():
         "status": current_status,
         "f1_connected": is_f1_conn,
         "bulb_connected": kasa_mgr.connected,
+        "last_frame_age": monitor.seconds_since_last_frame() if monitor else None,
         "log": last_log,
         "kasa_ip": kasa_mgr.ip
     })
 
+@app.route('/api/metrics')
+def get_metrics():
+    """Prometheus text exposition of the flag pipeline latencies."""
+    body = metrics.render_prometheus()
+    age = monitor.seconds_since_last_frame() if monitor else None
+    if age is not None:
+        body += ("# HELP flag_last_frame_age_seconds Seconds since the monitor last received data.\n"
+                 "# TYPE flag_last_frame_age_seconds gauge\n"
+                 f"flag_last_frame_age_seconds{{series=\"f1\"}} {age:.3f}\n")
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
 @app.route('/api/config/ip', methods=['POST'])
 def update_ip():
     data = request.json